@@ -0,0 +1,127 @@
+import itertools
+import logging
+import threading
+
+
+class _Entry:
+    """One recorded record: what is needed to rebuild it, nothing formatted"""
+    __slots__ = ("seq", "name", "levelno", "pathname", "lineno", "func_name", "created",
+                 "thread", "thread_name", "msg", "args", "exc_info", "stack_info", "context")
+
+    def __init__(self):
+        self.seq = -1
+
+
+class FlightRecorderHandler(logging.Handler):
+    """Keeps the last capacity records in memory and replays them on errors
+
+    Every record reaching the handler is copied into a preallocated ring of
+    _Entry slots with its message and arguments as given: nothing is
+    formatted or sanitized, and the record itself is not kept. When a
+    record at or above trigger_level arrives, the recorded records that
+    each target handler filtered out by level, plus the next `after` ones,
+    are rebuilt, passed through prepare (setup_logging uses sanitize_record)
+    and handed to the targets. Replayed records carry
+    record.flight_recorder = True, which FlushingQueueListener and the log
+    aggregator honour by skipping their handler level checks.
+
+    targets is read at every dump, so a list can still grow after the
+    recorder is created. Arguments are stored by reference; a mutable
+    argument changed after the call is replayed with its new value.
+    """
+    def __init__(self, targets=(), capacity=1000, trigger_level=logging.ERROR, after=50, prepare=None):
+        super().__init__()
+        self.targets = targets
+        self.capacity = capacity
+        self.trigger_level = trigger_level
+        self.after = after
+        self.prepare = prepare
+        self.dumps = 0
+        self.dumped = 0
+        self._ring = [_Entry() for _ in range(capacity)]
+        self._sequence = itertools.count()
+        self._replayed_through = -1
+        self._following = 0
+        self._dump_lock = threading.Lock()
+
+    def handle(self, record):
+        # No handler lock: every record claims its own slot, and replays
+        # re-check each slot's sequence number while copying it out
+        if record.__dict__.get("flight_recorder"):
+            return False
+        if self.filters and not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def emit(self, record):
+        seq = next(self._sequence)
+        entry = self._ring[seq % self.capacity]
+        entry.seq = -1
+        entry.name = record.name
+        entry.levelno = record.levelno
+        entry.pathname = record.pathname
+        entry.lineno = record.lineno
+        entry.func_name = record.funcName
+        entry.created = record.created
+        entry.thread = record.thread
+        entry.thread_name = record.threadName
+        entry.msg = record.msg
+        entry.args = record.args
+        entry.exc_info = record.exc_info
+        entry.stack_info = record.stack_info
+        entry.context = record.__dict__.get("context")
+        entry.seq = seq
+        if record.levelno >= self.trigger_level:
+            self.dump(seq)
+        elif self._following:
+            self._follow(seq)
+
+    def dump(self, trigger_seq):
+        """Replay the records recorded before trigger_seq that were not replayed yet"""
+        with self._dump_lock:
+            first = max(self._replayed_through + 1, trigger_seq - self.capacity + 1)
+            records = [record for record in map(self._rebuild, range(first, trigger_seq))
+                       if record is not None]
+            self._replayed_through = trigger_seq
+            self._following = self.after
+            self.dumps += 1
+        self._replay(records)
+
+    def _follow(self, seq):
+        with self._dump_lock:
+            if not self._following or seq <= self._replayed_through:
+                return
+            self._following -= 1
+            self._replayed_through = seq
+            record = self._rebuild(seq)
+        if record is not None:
+            self._replay([record])
+
+    def _rebuild(self, seq):
+        entry = self._ring[seq % self.capacity]
+        if entry.seq != seq:
+            return None
+        fields = (entry.name, entry.levelno, entry.pathname, entry.lineno, entry.msg, entry.args,
+                  entry.exc_info, entry.func_name, entry.stack_info)
+        created, thread, thread_name, context = entry.created, entry.thread, entry.thread_name, entry.context
+        if entry.seq != seq:
+            return None  # overwritten while it was being copied
+        record = logging.LogRecord(*fields)
+        record.relativeCreated -= (record.created - created) * 1000
+        record.created = created
+        record.msecs = int((created - int(created)) * 1000) + 0.0
+        record.thread, record.threadName = thread, thread_name
+        if context is not None:
+            record.context = context
+        record.flight_recorder = True
+        return record
+
+    def _replay(self, records):
+        for record in records:
+            if self.prepare is not None:
+                self.prepare(record)
+            for target in self.targets:
+                if record.levelno < target.level:
+                    target.handle(record)
+        self.dumped += len(records)
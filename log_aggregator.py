@@ -0,0 +1,332 @@
+import hmac
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+AGGREGATOR_HOST = "127.0.0.1"
+
+
+class AggregatorHandler(logging.Handler):
+    """Ships records to the log aggregator process over a local socket
+
+    Records are encoded as JSON lines and sent in batches by a background
+    thread, which reconnects (and respawns the aggregator through
+    spawn_aggregator) whenever the connection drops. Each connection opens
+    with token (see aggregator_token) and every record carries a sequence
+    number; records stay queued until the aggregator acknowledges their
+    batch, and a batch resent after a timeout is deduplicated by the
+    aggregator, so records are neither lost nor written twice. Once max_pending records
+    are waiting, emit() blocks for up to block_timeout seconds; if the
+    queue is still full the record is dropped and counted in dropped, and
+    later records are dropped without waiting until the sender makes
+    progress again. Stalls and aggregator processes that exit with an
+    error are reported on stderr.
+    """
+    def __init__(self, port, host=AGGREGATOR_HOST, max_pending=100000,
+                 batch_size=500, retry_interval=0.5, spawn_aggregator=None,
+                 block_timeout=5.0, token=None):
+        super().__init__()
+        self.address = (host, port)
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.spawn_aggregator = spawn_aggregator
+        self.block_timeout = block_timeout
+        self.token = token
+        self.dropped = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._sender_id = f"{os.getpid()}-{secrets.token_hex(8)}"
+        self._next_seq = 0
+        self._sock = None
+        self._reader = None
+        self._closed = False
+        self._stalled = False
+        self._acked = 0
+        self._flush_timed_out_at = None
+        self._last_spawn = 0.0
+        self._spawned = None
+        self._spawn_failed = False
+        self._sender = threading.Thread(target=self._run_sender, name="log-aggregator-sender", daemon=True)
+        self._sender.start()
+
+    def _encode(self, record):
+        data = dict(record.__dict__)
+        data["msg"] = record.getMessage()
+        data["args"] = None
+        if record.exc_info and not record.exc_text:
+            data["exc_text"] = logging.Formatter().formatException(record.exc_info)
+        data["exc_info"] = None
+        data.pop("message", None)
+        return json.dumps(data, default=str) + "\n"
+
+    def emit(self, record):
+        try:
+            line = self._encode(record)
+            stalled = False
+            with self._cond:
+                if not self._stalled:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._pending) >= self.max_pending and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stalled = stalled = True
+                            break
+                        self._cond.wait(remaining)
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                else:
+                    self._next_seq += 1
+                    self._pending.append((self._next_seq, line))
+                    self._cond.notify_all()
+            if stalled:
+                print(f"Log aggregator on port {self.address[1]} is not accepting records; "
+                      f"dropping them until it catches up", file=sys.stderr)
+        except Exception:
+            self.handleError(record)
+
+    def _connect(self):
+        try:
+            self._sock = socket.create_connection(self.address, timeout=5)
+            self._reader = self._sock.makefile("rb")
+            hello = {"_hello": self._sender_id, "token": self.token}
+            self._sock.sendall((json.dumps(hello) + "\n").encode("utf-8"))
+            self._spawn_failed = False
+            return True
+        except OSError:
+            self._disconnect()
+            self._check_spawned()
+            # Give a freshly spawned aggregator a few seconds to bind first
+            if self.spawn_aggregator is not None and time.monotonic() - self._last_spawn > 5.0:
+                self._last_spawn = time.monotonic()
+                self._spawned = self.spawn_aggregator()
+            return False
+
+    def _check_spawned(self):
+        # Exit code 0 means another aggregator already held the port
+        returncode = self._spawned.poll() if self._spawned is not None else None
+        if not returncode:
+            return
+        self._spawned = None
+        if not self._spawn_failed:  # once per outage, not once per respawn
+            self._spawn_failed = True
+            print(f"Log aggregator on port {self.address[1]} exited with code {returncode}; see "
+                  f"{os.path.basename(aggregator_error_path('', self.address[1]))} in the log directory",
+                  file=sys.stderr)
+
+    def _run_sender(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending or (self._closed and self._sock is None):
+                    return  # close() already gave the aggregator its chance
+                batch = [self._pending[i] for i in range(min(self.batch_size, len(self._pending)))]
+
+            if self._sock is None and not self._connect():
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed, self.retry_interval)
+                continue
+            last_seq = batch[-1][0]
+            lines = [f'{{"_seq":{seq},{line[1:]}' for seq, line in batch]
+            lines.append(f'{{"_ack":{last_seq}}}\n')
+            try:
+                self._sock.sendall("".join(lines).encode("utf-8"))
+                # Part of the batch may have been written before a timeout; it is
+                # resent, and the aggregator skips the sequence numbers it has seen
+                if self._reader.readline() != f"{last_seq}\n".encode("ascii"):
+                    raise OSError("batch not acknowledged")
+            except OSError:
+                self._disconnect()
+                continue
+
+            with self._cond:
+                for _ in batch:
+                    self._pending.popleft()
+                self._stalled = False
+                self._acked += len(batch)
+                self._cond.notify_all()
+
+    def _disconnect(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def flush(self, timeout=10.0):
+        """Wait until queued records have been acknowledged by the aggregator
+
+        Returns at once if an earlier flush timed out and nothing has been
+        acknowledged since (logging.shutdown flushes before close() does).
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._pending and self._flush_timed_out_at == self._acked:
+                return
+            while self._pending and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            self._flush_timed_out_at = self._acked if self._pending else None
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._sender.join(timeout=1.0)
+        self._disconnect()
+        with self._cond:
+            self.dropped += len(self._pending)
+            self._pending.clear()
+        super().close()
+
+
+class _RecordStreamHandler(socketserver.StreamRequestHandler):
+    """Reads JSON-lines records from one worker connection"""
+    def handle(self):
+        hello = json.loads(self.rfile.readline() or b"null")
+        if not isinstance(hello, dict) or not self.server.authenticate(hello.get("token")):
+            return
+        sender = str(hello.get("_hello"))
+        self.server.track_connection(1)
+        root_logger = logging.getLogger()
+        try:
+            for line in self.rfile:
+                if not line.endswith(b"\n"):
+                    break  # the worker died mid-record
+                data = json.loads(line)
+                if "_ack" in data:
+                    self.wfile.write(f"{data['_ack']}\n".encode("ascii"))
+                    continue
+                if not self.server.first_delivery(sender, data.pop("_seq", None)):
+                    continue
+                record = logging.makeLogRecord(data)
+                if getattr(record, "flight_recorder", False):
+                    # Replayed by a worker's flight recorder, below the sinks' levels on purpose
+                    for handler in root_logger.handlers:
+                        handler.handle(record)
+                else:
+                    root_logger.handle(record)
+        finally:
+            self.server.track_connection(-1)
+
+
+class AggregatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = os.name != "nt"
+
+    def __init__(self, port, host=AGGREGATOR_HOST, token=None):
+        super().__init__((host, port), _RecordStreamHandler)
+        self.token = token
+        self.connections = 0
+        self.last_activity = time.monotonic()
+        self._delivered = {}
+        self._lock = threading.Lock()
+
+    def authenticate(self, token):
+        if self.token is None:
+            return True
+        return isinstance(token, str) and hmac.compare_digest(token, self.token)
+
+    def first_delivery(self, sender, seq):
+        """False if sender's record seq was already written (its batch is being resent)"""
+        if seq is None:
+            return True
+        with self._lock:
+            if seq <= self._delivered.get(sender, 0):
+                return False
+            self._delivered[sender] = seq
+            return True
+
+    def track_connection(self, delta):
+        with self._lock:
+            self.connections += delta
+            self.last_activity = time.monotonic()
+
+
+def run_aggregator(port, sink_config, idle_timeout=300.0):
+    """Own the file, MongoDB and cleanup sinks and write every worker's records
+
+    Returns False straight away if another aggregator already holds the port.
+    Exits once no worker has been connected for idle_timeout seconds.
+    """
+    from .log_config import setup_logging, shutdown_logging
+
+    try:
+        server = AggregatorServer(port, token=aggregator_token(sink_config.get("log_directory") or ".", port))
+    except OSError:
+        return False
+
+    setup_logging(**dict(sink_config, console=False, aggregator_port=None))
+    thread = threading.Thread(target=server.serve_forever, name="log-aggregator", daemon=True)
+    thread.start()
+    try:
+        while server.connections or time.monotonic() - server.last_activity < idle_timeout:
+            time.sleep(1.0)
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutdown_logging()
+        logging.shutdown()
+    return True
+
+
+def aggregator_token(log_directory, port):
+    """Shared secret that workers present to the aggregator on port
+
+    Kept in an owner-only file in the log directory and created by
+    whichever process asks first, so workers and the aggregator they spawn
+    agree on it without passing it around.
+    """
+    path = os.path.join(log_directory, f".log-aggregator-{port}.token")
+    if not os.path.exists(path):
+        os.makedirs(log_directory, exist_ok=True)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with os.fdopen(os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            f.write(secrets.token_hex(16))
+        try:
+            os.link(partial, path)  # fails if another process got there first
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(partial)
+    with open(path, encoding="ascii") as f:
+        return f.read()
+
+
+def aggregator_error_path(log_directory, port):
+    # Named so it never matches "<log_file>.*" (see _mongo_spill_path in log_config)
+    return os.path.join(log_directory, f"log-aggregator-{port}.err")
+
+
+def spawn_aggregator(port, sink_config):
+    """Start a detached aggregator process; it exits at once if one is running
+
+    Its stderr is appended to aggregator_error_path() in the log directory.
+    """
+    log_directory = sink_config.get("log_directory") or "."
+    os.makedirs(log_directory, exist_ok=True)
+    with open(aggregator_error_path(log_directory, port), "ab") as errors:
+        process = subprocess.Popen(
+            [sys.executable, "-m", f"{__package__}.log_aggregator", str(port)],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p)),
+            start_new_session=True,
+        )
+    # Sink settings include credentials, so they go over stdin, not argv
+    process.stdin.write(json.dumps(sink_config).encode("utf-8"))
+    process.stdin.close()
+    return process
+
+
+if __name__ == "__main__":
+    run_aggregator(int(sys.argv[1]), json.loads(sys.stdin.read()))
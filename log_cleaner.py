@@ -1,80 +1,227 @@
-import os
-import glob
-import time
-import schedule
-import threading
-import logging
-
-class LogCleaner:
-    def __init__(self):
-        self.log_directory = "logs"
-        self.log_base_name = "app.log"
-        self.days_to_keep = 7
-        self.cleanup_time = "02:00"
-        self.auto_cleanup = False
-        self.running = False
-        self.logger = logging.getLogger(__name__)
-        
-    def cleanup_old_logs(self):
-        """Clean up log files older than specified days"""
-        if self.days_to_keep <= 0:
-            return
-            
-        current_time = time.time()
-        cutoff_time = current_time - (self.days_to_keep * 24 * 3600)
-        
-        # Ensure log directory exists
-        if not os.path.exists(self.log_directory):
-            self.logger.warning(f"Log directory {self.log_directory} does not exist")
-            return
-            
-        # Pattern for rotated log files
-        patterns = [
-            f"{self.log_base_name}.*",
-            f"{self.log_base_name}-*",
-        ]
-        
-        deleted_count = 0
-        for pattern in patterns:
-            files = glob.glob(os.path.join(self.log_directory, pattern))
-            for file_path in files:
-                try:
-                    if (os.path.isfile(file_path) and 
-                        os.path.getmtime(file_path) < cutoff_time):
-                        os.remove(file_path)
-                        deleted_count += 1
-                        self.logger.info(f"Deleted old log file: {os.path.basename(file_path)}")
-                except (OSError, Exception) as e:
-                    self.logger.error(f"Error deleting log file {file_path}: {e}")
-        
-        if deleted_count > 0:
-            self.logger.info(f"Cleaned up {deleted_count} old log files (retention: {self.days_to_keep} days)")
-    
-    def start_scheduled_cleanup(self):
-        """Start scheduled cleanup if enabled"""
-        if self.auto_cleanup:
-            self.running = True
-            
-            # Schedule daily cleanup
-            schedule.every().day.at(self.cleanup_time).do(self.cleanup_old_logs)
-            
-            def run_scheduler():
-                while self.running:
-                    schedule.run_pending()
-                    time.sleep(60)  # Check every minute
-                    
-            # Start scheduler in background thread
-            self.scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-            self.scheduler_thread.start()
-            self.logger.info(f"Log cleanup scheduler started (runs daily at {self.cleanup_time})")
-        else:
-            self.logger.info("Auto log cleanup is disabled")
-    
-    def stop_scheduled_cleanup(self):
-        """Stop the scheduled cleanup"""
-        self.running = False
-        if hasattr(self, 'scheduler_thread'):
-            self.scheduler_thread.join(timeout=1.0)
-
-# Singleton instance
+import os
+import time
+import threading
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .log_index import INDEX_SUFFIX, index_path, write_index
+from .log_metrics import metrics
+from .sensitive_info import SecurityUtils
+
+RotatedFile = namedtuple("RotatedFile", ["path", "mtime", "size"])
+
+
+class LogCleaner:
+    def __init__(self):
+        self.log_directory = "logs"
+        self.log_base_name = "app.log"
+        self.days_to_keep = 7
+        self.max_total_bytes = None
+        self.cleanup_time = "02:00"
+        self.auto_cleanup = False
+        self.running = False
+        self.delete_workers = 4
+        self.delete_batch_size = 500
+        self.index_rotated = True
+        # MongoHandler writing day/hour partitions, dropped with the same retention
+        self.mongo_handler = None
+        self.logger = logging.getLogger(__name__)
+        # Rotated files keyed by the suffix after the base name (the date for
+        # TimedRotatingFileHandler), kept current by rollovers between scans
+        self._index = {}
+        self._index_key = None
+        self._lock = threading.Lock()
+
+    def _rotated_prefixes(self):
+        return (f"{self.log_base_name}.", f"{self.log_base_name}-")
+
+    def _rotated_suffix(self, name):
+        if name.startswith(self._rotated_prefixes()) and len(name) > len(self.log_base_name) + 1:
+            return name[len(self.log_base_name) + 1:]
+        return None
+
+    def scan(self):
+        """Rebuild the rotated-file index with a single directory pass
+
+        Sidecar indexes and partial files are not rotated logs; a sidecar is
+        deleted along with its log.
+        """
+        index = {}
+        prefixes = self._rotated_prefixes()
+        skip = len(self.log_base_name) + 1
+        with os.scandir(self.log_directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if (not name.startswith(prefixes) or len(name) == skip
+                        or name.endswith((INDEX_SUFFIX, ".tmp"))):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                index[name[skip:]] = RotatedFile(entry.path, stat.st_mtime, stat.st_size)
+        with self._lock:
+            self._index = index
+            self._index_key = (self.log_directory, self.log_base_name)
+        return index
+
+    def cleanup_old_logs(self, rescan=True):
+        """Clean up log files older than days_to_keep or beyond max_total_bytes"""
+        self.drop_mongo_partitions()
+        if self.days_to_keep <= 0 and not self.max_total_bytes:
+            return
+
+        # Ensure log directory exists
+        if not os.path.exists(self.log_directory):
+            self.logger.warning(f"Log directory {self.log_directory} does not exist")
+            return
+
+        started = time.perf_counter()
+        if rescan or self._index_key != (self.log_directory, self.log_base_name):
+            self.scan()
+
+        with self._lock:
+            files = list(self._index.items())
+
+        expired = []
+        if self.days_to_keep > 0:
+            cutoff_time = time.time() - (self.days_to_keep * 24 * 3600)
+            expired = [item for item in files if item[1].mtime < cutoff_time]
+
+        if self.max_total_bytes:
+            expired_suffixes = {suffix for suffix, _ in expired}
+            kept = sorted((item for item in files if item[0] not in expired_suffixes),
+                          key=lambda item: item[1].mtime)
+            total = sum(rotated.size for _, rotated in kept)
+            over = 0
+            while over < len(kept) and total > self.max_total_bytes:
+                total -= kept[over][1].size
+                over += 1
+            expired += kept[:over]
+
+        deleted_count = self._delete(expired)
+        if metrics.enabled:
+            metrics.observe_cleanup(time.perf_counter() - started, deleted_count)
+        if deleted_count > 0:
+            self.logger.info(f"Cleaned up {deleted_count} old log files (retention: {self.days_to_keep} days"
+                             + (f", {self.max_total_bytes} bytes)" if self.max_total_bytes else ")"))
+
+    def drop_mongo_partitions(self):
+        """Drop MongoDB log partitions older than days_to_keep"""
+        if self.days_to_keep <= 0 or self.mongo_handler is None:
+            return
+        try:
+            dropped = self.mongo_handler.drop_partitions_before(time.time() - self.days_to_keep * 24 * 3600)
+        except Exception as e:
+            sanitized_error = SecurityUtils.sanitize_error_message(str(e))
+            self.logger.error(f"Error dropping MongoDB log partitions: {sanitized_error}")
+            return
+        if dropped:
+            self.logger.info(f"Dropped {len(dropped)} MongoDB log partitions "
+                             f"(retention: {self.days_to_keep} days)")
+
+    def _delete_batch(self, batch):
+        deleted = []
+        for suffix, rotated in batch:
+            try:
+                os.remove(rotated.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.logger.error(f"Error deleting log file {rotated.path}: {e}")
+                continue
+            deleted.append((suffix, rotated))
+            try:
+                os.remove(index_path(rotated.path))
+            except OSError:
+                pass
+        return deleted
+
+    def _delete(self, expired):
+        if not expired:
+            return 0
+
+        batches = [expired[i:i + self.delete_batch_size]
+                   for i in range(0, len(expired), self.delete_batch_size)]
+        if len(batches) == 1 or self.delete_workers <= 1:
+            results = list(map(self._delete_batch, batches))
+        else:
+            with ThreadPoolExecutor(max_workers=self.delete_workers) as pool:
+                results = list(pool.map(self._delete_batch, batches))
+
+        deleted = [item for batch in results for item in batch]
+        with self._lock:
+            for suffix, _ in deleted:
+                self._index.pop(suffix, None)
+        # Log outside the lock: a rollover holding the file handler lock may need it
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for _, rotated in deleted:
+                self.logger.debug(f"Deleted old log file: {os.path.basename(rotated.path)}")
+        return len(deleted)
+
+    def on_rollover(self, rotated_path):
+        """Index a freshly rotated file and, with auto_cleanup, enforce retention
+
+        Both run in the background. With index_rotated, a plain rotated file
+        gets its time/level sidecar index (see log_index).
+        """
+        try:
+            stat = os.stat(rotated_path)
+        except OSError:
+            return
+        suffix = self._rotated_suffix(os.path.basename(rotated_path))
+        if suffix is not None:
+            with self._lock:
+                self._index[suffix] = RotatedFile(rotated_path, stat.st_mtime, stat.st_size)
+
+        rescan = self._index_key != (self.log_directory, self.log_base_name)
+        threading.Thread(target=self._after_rollover, args=(rotated_path, rescan),
+                         name="log-cleaner", daemon=True).start()
+
+    def _after_rollover(self, rotated_path, rescan):
+        if self.index_rotated:
+            try:
+                write_index(rotated_path)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Error indexing log file {rotated_path}: {e}")
+        if self.auto_cleanup:
+            self.cleanup_old_logs(rescan=rescan)
+
+    def rotator(self, source, dest):
+        """Rotator for TimedRotatingFileHandler that indexes (and cleans up) on rollover"""
+        if os.path.exists(source):
+            os.rename(source, dest)
+            self.on_rollover(dest)
+
+    def start_scheduled_cleanup(self):
+        """Start scheduled cleanup if enabled"""
+        if self.auto_cleanup:
+            import schedule
+
+            self.running = True
+
+            # Schedule daily cleanup
+            schedule.every().day.at(self.cleanup_time).do(self.cleanup_old_logs)
+
+            def run_scheduler():
+                while self.running:
+                    schedule.run_pending()
+                    time.sleep(60)  # Check every minute
+
+            # Start scheduler in background thread
+            self.scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+            self.scheduler_thread.start()
+            self.logger.info(f"Log cleanup scheduler started (runs daily at {self.cleanup_time})")
+        else:
+            self.logger.info("Auto log cleanup is disabled")
+
+    def stop_scheduled_cleanup(self):
+        """Stop the scheduled cleanup"""
+        self.running = False
+        if hasattr(self, 'scheduler_thread'):
+            self.scheduler_thread.join(timeout=1.0)
+
+# Singleton instance
 log_cleaner = LogCleaner()
\ No newline at end of file
@@ -1,113 +1,381 @@
-import logging
-import os
-from config.settings import settings
-from logging.handlers import TimedRotatingFileHandler
-from .mongo_logs import MongoHandler
-from .log_cleaner import log_cleaner
-from .sensitive_info import SecurityUtils
-
-
-class SanitizingFormatter(logging.Formatter):
-    """Formatter that sanitizes sensitive info before logging"""
-    def format(self, record):
-        msg = super().format(record)
-        return SecurityUtils.sanitize_error_message(msg)
-
-def setup_logging(mongo_uri=None, db_name=None, collection_name=None,
-                 log_file=None, log_directory=None, log_level=None,
-                 days_to_keep=None, cleanup_time=None, auto_cleanup=False):
-
-    root_logger = logging.getLogger()
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-
-    # Sanitizing formatter
-    formatter = SanitizingFormatter(
-        "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-    )
-
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(getattr(logging, log_level))
-    console_handler.setFormatter(formatter)
-
-    # File handler
-    file_handler = None
-    try:
-        if not os.path.exists(log_directory):
-            os.makedirs(log_directory, exist_ok=True)
-
-        log_file_path = os.path.join(log_directory, log_file)
-
-        file_handler = TimedRotatingFileHandler(
-            filename=log_file_path,
-            when="midnight",
-            interval=1,
-            backupCount=0,
-            encoding="utf-8",
-            utc=True
-        )
-        file_handler.setLevel(getattr(logging, log_level))
-        file_handler.setFormatter(formatter)
-        file_handler.suffix = "%Y-%m-%d"
-
-    except Exception as e:
-        sanitized_error = SecurityUtils.sanitize_error_message(str(e))
-        root_logger.error(f"Failed to setup file logging: {sanitized_error}")
-
-    # Root logger
-    root_logger.setLevel(getattr(logging, log_level))
-    root_logger.addHandler(console_handler)
-    if file_handler:
-        root_logger.addHandler(file_handler)
-
-    # MongoDB handler
-    if mongo_uri and db_name and collection_name:
-        try:
-            mongo_handler = MongoHandler(mongo_uri, db_name, collection_name)
-            mongo_handler.setLevel(getattr(logging, log_level))
-            mongo_handler.setFormatter(formatter)
-            root_logger.addHandler(mongo_handler)
-            root_logger.info("MongoDB logging enabled successfully")
-        except Exception as e:
-            sanitized_error = SecurityUtils.sanitize_error_message(str(e), [mongo_uri])
-            root_logger.error(f"Failed to setup MongoDB logging: {sanitized_error}")
-    else:
-        root_logger.info("MongoDB logging disabled - missing configuration")
-
-    # Log cleaner
-    try:
-        log_cleaner.log_directory = log_directory
-        log_cleaner.log_base_name = log_file
-        log_cleaner.days_to_keep = days_to_keep
-        log_cleaner.cleanup_time = cleanup_time
-        log_cleaner.auto_cleanup = auto_cleanup
-
-        if auto_cleanup:
-            log_cleaner.start_scheduled_cleanup()
-
-        log_cleaner.cleanup_old_logs()
-    except Exception as e:
-        sanitized_error = SecurityUtils.sanitize_error_message(str(e))
-        root_logger.error(f"Failed to setup log cleaner: {sanitized_error}")
-
-    root_logger.info("Logging setup completed successfully")
-    return root_logger
-
-
-def log_with_context(logger, level, message, **context):
-    """Log with sanitized extra context"""
-    try:
-        sanitized_context = SecurityUtils.sanitize_dict(context)
-        if level == "info":
-            logger.info(message, extra=sanitized_context)
-        elif level == "warning":
-            logger.warning(message, extra=sanitized_context)
-        elif level == "error":
-            logger.error(message, extra=sanitized_context)
-        elif level == "debug":
-            logger.debug(message, extra=sanitized_context)
-        elif level == "critical":
-            logger.critical(message, extra=sanitized_context)
-    except Exception as e:
-        getattr(logger, level)(f"{message} [Context logging failed: {e}]")
+import atexit
+import logging
+import os
+import time
+from logging.handlers import TimedRotatingFileHandler
+from .mongo_logs import MongoHandler
+from .log_cleaner import log_cleaner
+from .sensitive_info import SecurityUtils
+from .queue_logging import build_queue_pipeline
+from .log_aggregator import AggregatorHandler, aggregator_token, spawn_aggregator
+from .timed_rotating_log import BufferedTimedRotatingFileHandler
+from .structured_logging import CONTEXT_MAX_DEPTH, CONTEXT_MAX_ITEMS
+from .log_throttle import ThrottlingFilter
+from .flight_recorder import FlightRecorderHandler
+from .log_metrics import metrics as logging_metrics
+
+_queue_listener = None
+_throttle_filter = None
+
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+
+def sanitize_record(record, formatter=None):
+    """Sanitize a record's message and exception text in place, once per record"""
+    if getattr(record, "sanitized", False):
+        return record
+
+    start = time.perf_counter() if logging_metrics.enabled and logging_metrics.sample_sanitize() else None
+    record.msg = SecurityUtils.sanitize_error_message(record.getMessage())
+    record.args = None
+    if record.exc_info and not record.exc_text:
+        record.exc_text = (formatter or logging.Formatter()).formatException(record.exc_info)
+    if record.exc_text:
+        record.exc_text = SecurityUtils.sanitize_error_message(record.exc_text)
+    if record.stack_info:
+        record.stack_info = SecurityUtils.sanitize_error_message(record.stack_info)
+    record.sanitized = True
+    if start is not None:
+        logging_metrics.observe_sanitize(time.perf_counter() - start)
+    return record
+
+
+class SanitizingFormatter(logging.Formatter):
+    """Formatter that sanitizes sensitive info before logging
+
+    Only the message, exception and stack text are sanitized, and the result
+    is cached on the record so every handler sharing it reuses the work.
+    """
+    def format(self, record):
+        sanitize_record(record, self)
+        return super().format(record)
+
+def setup_logging(mongo_uri=None, db_name=None, collection_name=None,
+                 log_file=None, log_directory=None, log_level=None,
+                 days_to_keep=None, cleanup_time=None, auto_cleanup=False,
+                 retention_bytes=None,
+                 async_mode=False, queue_size=10000, queue_policy="block",
+                 queue_drop_level="WARNING", console=True, aggregator_port=None,
+                 file_durability=None, throttle=None, collect_metrics=True,
+                 mongo_connect="background", mongo_partition=None, mongo_ttl_days=None,
+                 flight_recorder=None, known_secrets=None):
+    """Configure root logging.
+
+    With async_mode the root logger only enqueues records into a bounded
+    queue; a background listener writes them to the console, file and
+    MongoDB sinks. queue_policy picks what happens when the queue is full
+    ("block", "drop_newest" or "drop_by_level", which only drops records
+    below queue_drop_level).
+
+    With auto_cleanup, retention (days_to_keep and, if set, retention_bytes
+    of rotated files) is enforced right after each file rollover.
+
+    file_durability switches the file sink to group commit ("record",
+    "batch", "fsync_batch" or "fsync_interval", see
+    BufferedTimedRotatingFileHandler); by default it flushes every record.
+
+    throttle (ThrottlingFilter options, e.g. {"burst": 10, "window": 1.0,
+    "sample_rates": {"app.db": 0.1}}) suppresses bursts of identical
+    records and samples DEBUG/INFO before they reach any sink.
+
+    flight_recorder (FlightRecorderHandler options, e.g. {"capacity": 1000,
+    "trigger_level": logging.ERROR}) also creates DEBUG records, but only
+    copies them into an in-memory ring; when an ERROR arrives the records
+    the sinks skipped are sanitized and written just before it.
+
+    mongo_uri and known_secrets (tokens, passwords or other URIs loaded
+    from settings) replace SecurityUtils.KNOWN_SECRETS: each is sanitized
+    once and masked wherever it appears in a logged message.
+
+    collect_metrics instruments every installed handler (see log_metrics;
+    log_metrics.prometheus_text() renders them for a /metrics route).
+
+    With mongo_connect="background" (the default) the MongoDB sink connects
+    from its own thread and buffers records until then, so an unreachable
+    server never delays startup; records it cannot deliver are spilled to
+    mongo-spill-<log_file>.jsonl and replayed later. "blocking" connects
+    before returning and logs the failure instead of installing the sink.
+    mongo_partition ("day" or "hour") writes to one collection per period,
+    and the log cleaner drops the partitions older than days_to_keep;
+    mongo_ttl_days adds a TTL index instead (see MongoHandler).
+
+    With aggregator_port (e.g. under several uvicorn workers) this process
+    only logs to the console and sends records to a single aggregator
+    process on that local port, which is started on demand and owns the
+    file rotation, log cleaner and MongoDB sinks.
+    """
+    global _queue_listener, _throttle_filter
+
+    root_logger = logging.getLogger()
+    # Closed, not just removed: Mongo and buffered handlers hold threads and unwritten records
+    previous = root_logger.handlers[:]
+    if _queue_listener is not None:
+        previous += _queue_listener.handlers
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    shutdown_logging()
+    for handler in previous:
+        try:
+            handler.close()
+        except Exception:
+            pass
+    if throttle is not None:
+        _throttle_filter = ThrottlingFilter(**throttle)
+        if collect_metrics:
+            logging_metrics.register_source("throttle", _throttle_filter, ("suppressed", "sampled_out"))
+    logging_metrics.enabled = collect_metrics
+    SecurityUtils.clear_secrets()
+    SecurityUtils.register_secrets(mongo_uri, *(known_secrets or ()))
+
+    if aggregator_port:
+        sink_config = dict(
+            mongo_uri=mongo_uri, db_name=db_name, collection_name=collection_name,
+            log_file=log_file, log_directory=log_directory, log_level=log_level,
+            days_to_keep=days_to_keep, cleanup_time=cleanup_time, auto_cleanup=auto_cleanup,
+            retention_bytes=retention_bytes, async_mode=async_mode, queue_size=queue_size,
+            queue_policy=queue_policy, queue_drop_level=queue_drop_level,
+            file_durability=file_durability, mongo_connect=mongo_connect,
+            mongo_partition=mongo_partition, mongo_ttl_days=mongo_ttl_days,
+            known_secrets=list(known_secrets or ()),
+        )
+        return _setup_worker_logging(root_logger, log_level, console, aggregator_port, sink_config,
+                                     flight_recorder)
+
+    sinks = []
+
+    def attach(handler, name):
+        if collect_metrics:
+            logging_metrics.instrument_handler(handler, name)
+        if _throttle_filter is not None and _queue_listener is None:
+            handler.addFilter(_throttle_filter)
+        sinks.append(handler)
+        if _queue_listener is not None:
+            _queue_listener.handlers = tuple(sinks)
+        else:
+            root_logger.addHandler(handler)
+
+    # Sanitizing formatter
+    formatter = SanitizingFormatter(
+        "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+    )
+
+    # Console handler
+    console_handler = None
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(getattr(logging, log_level))
+        console_handler.setFormatter(formatter)
+
+    # File handler
+    file_handler = None
+    try:
+        if not os.path.exists(log_directory):
+            os.makedirs(log_directory, exist_ok=True)
+
+        log_file_path = os.path.join(log_directory, log_file)
+
+        if file_durability:
+            file_handler = BufferedTimedRotatingFileHandler(
+                filename=log_file_path,
+                when="midnight",
+                interval=1,
+                backupCount=0,
+                encoding="utf-8",
+                utc=True,
+                durability=file_durability
+            )
+        else:
+            file_handler = TimedRotatingFileHandler(
+                filename=log_file_path,
+                when="midnight",
+                interval=1,
+                backupCount=0,
+                encoding="utf-8",
+                utc=True
+            )
+        file_handler.setLevel(getattr(logging, log_level))
+        file_handler.setFormatter(formatter)
+        file_handler.suffix = "%Y-%m-%d"
+
+    except Exception as e:
+        sanitized_error = SecurityUtils.sanitize_error_message(str(e))
+        root_logger.error(f"Failed to setup file logging: {sanitized_error}")
+
+    # Root logger
+    root_logger.setLevel(getattr(logging, log_level))
+    queue_handler = None
+    if async_mode:
+        queue_handler, _queue_listener = build_queue_pipeline(
+            [], maxsize=queue_size, policy=queue_policy,
+            drop_level=getattr(logging, queue_drop_level)
+        )
+        if _throttle_filter is not None:
+            # Throttle before enqueueing so a storm never fills the queue
+            queue_handler.addFilter(_throttle_filter)
+        if collect_metrics:
+            logging_metrics.instrument_handler(queue_handler, "queue")
+            logging_metrics.register_source("queue", queue_handler, ("dropped",))
+    if flight_recorder is not None:
+        # Ahead of the sinks, so the replayed context lands before the error
+        _add_flight_recorder(root_logger, [queue_handler] if queue_handler else sinks, flight_recorder)
+    if queue_handler:
+        queue_handler.setLevel(getattr(logging, log_level))
+        root_logger.addHandler(queue_handler)
+    if console_handler:
+        attach(console_handler, "console")
+    if file_handler:
+        attach(file_handler, "file")
+
+    # MongoDB handler
+    mongo_handler = None
+    if mongo_uri and db_name and collection_name:
+        try:
+            spill_path = _mongo_spill_path(log_directory, log_file) if file_handler else None
+            mongo_handler = MongoHandler(mongo_uri, db_name, collection_name, spill_path=spill_path,
+                                         background_connect=mongo_connect == "background",
+                                         partition=mongo_partition, ttl_days=mongo_ttl_days)
+            mongo_handler.setLevel(getattr(logging, log_level))
+            mongo_handler.setFormatter(formatter)
+            attach(mongo_handler, "mongo")
+            if collect_metrics:
+                logging_metrics.register_source("mongo", mongo_handler, ("inserted", "spilled", "dropped"))
+            if mongo_handler.connected:
+                root_logger.info("MongoDB logging enabled successfully")
+            else:
+                root_logger.info("MongoDB logging enabled, connecting in the background")
+        except Exception as e:
+            sanitized_error = SecurityUtils.sanitize_error_message(str(e))
+            root_logger.error(f"Failed to setup MongoDB logging: {sanitized_error}")
+    else:
+        root_logger.info("MongoDB logging disabled - missing configuration")
+
+    # Log cleaner
+    try:
+        log_cleaner.log_directory = log_directory
+        log_cleaner.log_base_name = log_file
+        log_cleaner.days_to_keep = days_to_keep
+        log_cleaner.cleanup_time = cleanup_time
+        log_cleaner.auto_cleanup = auto_cleanup
+        log_cleaner.max_total_bytes = retention_bytes
+        log_cleaner.mongo_handler = mongo_handler if mongo_partition else None
+        if log_cleaner.mongo_handler is not None:
+            # A background connection is usually not up yet when cleanup_old_logs runs
+            # below; drop the expired partitions as soon as it is
+            mongo_handler.on_connect = log_cleaner.drop_mongo_partitions
+
+        if file_handler:
+            # Rotated files are indexed, and with auto_cleanup retention runs,
+            # right after each rollover instead of polling
+            file_handler.rotator = log_cleaner.rotator
+        elif auto_cleanup:
+            log_cleaner.start_scheduled_cleanup()
+
+        log_cleaner.cleanup_old_logs()
+    except Exception as e:
+        sanitized_error = SecurityUtils.sanitize_error_message(str(e))
+        root_logger.error(f"Failed to setup log cleaner: {sanitized_error}")
+
+    root_logger.info("Logging setup completed successfully")
+    return root_logger
+
+
+def _mongo_spill_path(log_directory, log_file):
+    """Spill file for the MongoDB sink
+
+    Named so it never matches "<log_file>.*", which LogCleaner,
+    TimedRotatingFileHandlerWithDeletion and log_index treat as rotated logs.
+    """
+    return os.path.join(log_directory, f"mongo-spill-{log_file}.jsonl")
+
+
+def _add_flight_recorder(root_logger, targets, options):
+    recorder = FlightRecorderHandler(targets, prepare=sanitize_record, **options)
+    root_logger.setLevel(logging.DEBUG)
+    root_logger.addHandler(recorder)
+    if logging_metrics.enabled:
+        logging_metrics.register_source("flight_recorder", recorder, ("dumps", "dumped"))
+    return recorder
+
+
+def _setup_worker_logging(root_logger, log_level, console, aggregator_port, sink_config,
+                          flight_recorder=None):
+    root_logger.setLevel(getattr(logging, log_level))
+    targets = []
+    if flight_recorder is not None:
+        _add_flight_recorder(root_logger, targets, flight_recorder)
+    console_handler = None
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(getattr(logging, log_level))
+        console_handler.setFormatter(SanitizingFormatter(
+            "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+        ))
+        root_logger.addHandler(console_handler)
+
+    aggregator_handler = AggregatorHandler(
+        aggregator_port,
+        spawn_aggregator=lambda: spawn_aggregator(aggregator_port, sink_config),
+        token=aggregator_token(sink_config["log_directory"] or ".", aggregator_port),
+    )
+    aggregator_handler.setLevel(getattr(logging, log_level))
+    root_logger.addHandler(aggregator_handler)
+    for handler, name in ((console_handler, "console"), (aggregator_handler, "aggregator")):
+        if handler is None:
+            continue
+        targets.append(handler)
+        if _throttle_filter is not None:
+            handler.addFilter(_throttle_filter)
+        if logging_metrics.enabled:
+            logging_metrics.instrument_handler(handler, name)
+    if logging_metrics.enabled:
+        logging_metrics.register_source("aggregator", aggregator_handler, ("dropped",))
+    root_logger.info(f"Logging to aggregator on port {aggregator_port} (pid {os.getpid()})")
+    return root_logger
+
+
+def shutdown_logging():
+    """Log pending throttle summaries, drain the async logging queue and flush its sinks"""
+    global _queue_listener, _throttle_filter
+    if _throttle_filter is not None:
+        _throttle_filter.flush()
+        _throttle_filter = None
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def log_with_context(logger, level, message, **context):
+    """Log with sanitized extra context
+
+    The level is checked first, so disabled calls skip sanitizing entirely.
+    New code should prefer structured_logging.get_logger(), which also
+    defers the context work until a handler emits the record.
+    """
+    if isinstance(level, str):
+        levelno = LOG_LEVELS.get(level.lower())
+    else:
+        levelno = level if isinstance(level, int) else None
+    if levelno is None:
+        # Never raise from a logging call; log the record with the bad level named instead
+        logger.warning(f"{message} [Unknown log level {level!r}, expected one of {list(LOG_LEVELS)}]",
+                       stacklevel=2)
+        return
+    if not logger.isEnabledFor(levelno):
+        return
+
+    try:
+        sanitized_context = SecurityUtils.sanitize_dict(
+            context, max_depth=CONTEXT_MAX_DEPTH, max_items=CONTEXT_MAX_ITEMS
+        )
+        logger.log(levelno, message, extra=sanitized_context, stacklevel=2)
+    except Exception as e:
+        logger.log(levelno, f"{message} [Context logging failed: {e}]", stacklevel=2)
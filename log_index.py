@@ -0,0 +1,401 @@
+import gzip
+import io
+import json
+import logging
+import mmap
+import os
+import re
+import sys
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+BLOCK_SIZE = 1024 * 1024
+# Longest block when no record header turns up (JSON lines, one huge record)
+MAX_BLOCK_SIZE = 4 * BLOCK_SIZE
+LEVEL_NAMES = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+# Start of a record written with "%(asctime)s [%(levelname)s] ..." (see setup_logging)
+_RECORD_RE = re.compile(rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) \[(\w+)\]", re.MULTILINE)
+_NEXT_RECORD_RE = re.compile(rb"\n(?=\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \[)")
+# The record header up to where %(message)s starts
+_HEADER_RE = re.compile(rb"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \[\w+\] [^\n]*?: ")
+
+
+@lru_cache(maxsize=None)
+def load_zstandard():
+    """The zstandard module, imported on first use; None if it is not installed"""
+    try:
+        import zstandard
+    except ImportError:  # zstd is optional; gzip is always available
+        return None
+    return zstandard
+
+
+def read_errors():
+    """Exceptions reading a truncated or corrupt plain, .gz or .zst log can raise"""
+    errors = (OSError, EOFError, zlib.error)
+    zstandard = load_zstandard()
+    return errors + (zstandard.ZstdError,) if zstandard is not None else errors
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def file_codec(path):
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return "plain"
+
+
+def block_compressor(codec, mtime=0):
+    """Function compressing a block into a standalone gzip member or zstd frame"""
+    if codec == "zstd":
+        return load_zstandard().ZstdCompressor(level=3).compress
+    if codec == "gzip":
+        return lambda block: gzip.compress(block, compresslevel=6, mtime=mtime)
+    return None
+
+
+def _iter_blocks(data):
+    """(offset, end) spans of about BLOCK_SIZE bytes that start on a record
+
+    With no record header before MAX_BLOCK_SIZE a span ends after its last
+    newline instead, or at MAX_BLOCK_SIZE if it has none.
+    """
+    offset = 0
+    while offset < len(data):
+        end = _block_end(data, offset)
+        yield offset, end
+        offset = end
+
+
+def _block_end(data, offset):
+    if offset + BLOCK_SIZE >= len(data):
+        return len(data)
+    limit = offset + MAX_BLOCK_SIZE
+    match = _NEXT_RECORD_RE.search(data, offset + BLOCK_SIZE, limit)
+    if match:
+        return match.start() + 1
+    if limit >= len(data):
+        return len(data)
+    return data.rfind(b"\n", offset, limit) + 1 or limit
+
+
+class _IndexBuilder:
+    """Collects the sparse index: one entry per block plus per-level block lists"""
+    def __init__(self, codec):
+        self.codec = codec
+        self.blocks = []
+        self.levels = {}
+
+    def add(self, offset, length, data):
+        records = _RECORD_RE.findall(data)
+        number = len(self.blocks)
+        if records:
+            # Threads can interleave slightly out of order, so keep the real range
+            timestamps = [timestamp for timestamp, _ in records]
+            first, last = min(timestamps).decode("ascii"), max(timestamps).decode("ascii")
+            for level in {level for _, level in records}:
+                self.levels.setdefault(level.decode("ascii"), []).append(number)
+        else:
+            first = last = None
+        self.blocks.append([offset, length, first, last])
+
+    def save(self, path):
+        index = {"version": INDEX_VERSION, "codec": self.codec, "size": os.path.getsize(path),
+                 "blocks": self.blocks, "levels": self.levels}
+        partial = index_path(path) + ".tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(partial, index_path(path))
+        return index
+
+
+def _map(f):
+    if os.fstat(f.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_index(path):
+    """Build and save the sidecar index of a plain (uncompressed) rotated log"""
+    builder = _IndexBuilder("plain")
+    with open(path, "rb") as f:
+        data = _map(f)
+        try:
+            for offset, end in _iter_blocks(data):
+                builder.add(offset, end - offset, data[offset:end])
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    return builder.save(path)
+
+
+def write_compressed(source_path, raw, codec, compress):
+    """Compress source_path into raw as independent per-block members
+
+    Each block becomes its own gzip member or zstd frame, so the archive is
+    still an ordinary .gz/.zst file but a query can decompress any block on
+    its own. Returns the builder; call save() once the archive is in place.
+    """
+    return write_chunks(_mapped_chunks(source_path), raw, codec, compress)
+
+
+def write_chunks(chunks, raw, codec, compress=None):
+    """Write record-aligned chunks to raw, compressing each one on its own
+
+    With compress None the chunks are written as they are (codec "plain").
+    Returns the builder; call save() once the file is in place.
+    """
+    builder = _IndexBuilder(codec)
+    for block in chunks:
+        packed = compress(block) if compress is not None else block
+        builder.add(raw.tell(), len(packed), block)
+        raw.write(packed)
+    return builder
+
+
+def load_index(path):
+    """The sidecar index of path, or None if it is missing or stale"""
+    try:
+        with open(index_path(path), encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index["size"] == os.path.getsize(path):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _bound(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        value = value.strftime("%Y-%m-%d %H:%M:%S,") + f"{value.microsecond // 1000:03d}"
+    return value.encode("ascii")
+
+
+def _level_names(level):
+    if level is None:
+        return None
+    levelno = level if isinstance(level, int) else getattr(logging, level.upper())
+    return {name for name in LEVEL_NAMES if getattr(logging, name) >= levelno}
+
+
+def _matching_records(data, start, end, levels, needle):
+    """Records in data (which starts on a record) that pass every filter"""
+    selected = None
+    for match in _RECORD_RE.finditer(data):
+        if selected is not None:
+            record = data[selected:match.start()]
+            if needle is None or needle in record:
+                yield record
+            selected = None
+        timestamp, level = match.groups()
+        if ((start is None or timestamp >= start)
+                and (end is None or timestamp[:len(end)] <= end)
+                and (levels is None or level in levels)):
+            selected = match.start()
+    if selected is not None:
+        record = data[selected:]
+        if needle is None or needle in record:
+            yield record
+
+
+def _selected_blocks(index, start, end, levels):
+    if levels is None:
+        candidates = range(len(index["blocks"]))
+    else:
+        candidates = sorted({number for name in levels for number in index["levels"].get(name, ())})
+    for number in candidates:
+        offset, length, first, last = index["blocks"][number]
+        if first is None:
+            continue
+        if start is not None and last.encode("ascii") < start:
+            continue
+        if end is not None and first.encode("ascii")[:len(end)] > end:
+            continue
+        yield offset, length
+
+
+def _indexed_chunks(path, index, start, end, levels):
+    codec = index["codec"]
+    if codec == "zstd":
+        decompress = load_zstandard().ZstdDecompressor().decompress
+    elif codec == "gzip":
+        decompress = lambda packed: zlib.decompress(packed, 31)
+    else:
+        decompress = lambda block: block
+    with open(path, "rb") as f:
+        data = _map(f)
+        try:
+            for offset, length in _selected_blocks(index, start, end, levels):
+                yield decompress(data[offset:offset + length])
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def _open_binary(path):
+    codec = file_codec(path)
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    if codec == "zstd":
+        zstandard = load_zstandard()
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True,
+                                                           read_across_frames=True)
+        return io.BufferedReader(reader, BLOCK_SIZE)
+    return open(path, "rb")
+
+
+def _mapped_chunks(path):
+    with open(path, "rb") as f:
+        data = _map(f)
+        try:
+            for offset, end in _iter_blocks(data):
+                yield data[offset:end]
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def iter_chunks(path):
+    """Contents of a plain, .gz or .zst log in chunks that start on a record
+
+    Plain files are mapped and compressed ones streamed, so memory stays
+    around BLOCK_SIZE whatever the size of the file. A chunk is cut at a
+    newline, or anywhere, once MAX_BLOCK_SIZE bytes go by without a record
+    header.
+    """
+    if file_codec(path) == "plain":
+        yield from _mapped_chunks(path)
+        return
+    with _open_binary(path) as stream:
+        carry = b""
+        while True:
+            data = stream.read(BLOCK_SIZE)
+            if not data:
+                break
+            data = carry + data
+            # carry holds no record start past its first byte; only look at what was read
+            cut = _last_record_start(data, max(len(carry) - 1, 0))
+            if cut == 0 and len(data) >= MAX_BLOCK_SIZE:
+                cut = data.rfind(b"\n") + 1 or len(data)
+            if cut == 0:
+                carry = data
+                continue
+            carry = data[cut:]
+            yield data[:cut]
+        if carry:
+            yield carry
+
+
+def record_at(data, position):
+    """(start, message_start, end) of the record around position in data
+
+    data must start on a record. message_start is where %(message)s begins,
+    or start if the record has no recognizable header.
+    """
+    start = data.rfind(b"\n", 0, position) + 1
+    while start > 0 and not _RECORD_RE.match(data, start):
+        start = data.rfind(b"\n", 0, start - 1) + 1
+    header = _HEADER_RE.match(data, start)
+    following = _NEXT_RECORD_RE.search(data, position)
+    end = following.start() + 1 if following else len(data)
+    return start, header.end() if header and header.end() <= end else start, end
+
+
+def _last_record_start(data, lowest=0):
+    """Offset of the last record starting after lowest, or 0 if there is none"""
+    position = len(data)
+    while True:
+        position = data.rfind(b"\n", lowest, position)
+        if position < 0:
+            return 0
+        if _RECORD_RE.match(data, position + 1):
+            return position + 1
+
+
+def query_file(path, start=None, end=None, level=None, contains=None, use_index=True):
+    """Yield the records in one log file that match the filters
+
+    start and end are datetimes or timestamp strings in the log's own
+    asctime format ("2024-05-01 14:05"); end is inclusive at its own
+    precision. level is a minimum level and contains a substring of the
+    record. With a valid sidecar index only the blocks that can match are
+    read (via mmap, decompressing just those blocks for .gz/.zst);
+    otherwise the file is streamed.
+    """
+    start, end = _bound(start), _bound(end)
+    levels = _level_names(level)
+    level_bytes = None if levels is None else {name.encode("ascii") for name in levels}
+    needle = contains.encode("utf-8") if contains else None
+
+    index = load_index(path) if use_index else None
+    if index is not None:
+        chunks = _indexed_chunks(path, index, start, end, levels)
+    else:
+        chunks = iter_chunks(path)
+    for chunk in chunks:
+        for record in _matching_records(chunk, start, end, level_bytes, needle):
+            yield record.rstrip(b"\r\n").decode("utf-8", "replace")
+
+
+def log_files(log_directory, log_file):
+    """Rotated files for log_file, oldest first, followed by the active file"""
+    prefix = log_file + "."
+    rotated = []
+    with os.scandir(log_directory) as entries:
+        for entry in entries:
+            name = entry.name
+            if (name.startswith(prefix) and not name.endswith((INDEX_SUFFIX, ".tmp"))
+                    and entry.is_file()):
+                rotated.append(entry.path)
+    rotated.sort()
+    active = os.path.join(log_directory, log_file)
+    if os.path.exists(active):
+        rotated.append(active)
+    return rotated
+
+
+def query_logs(log_directory, log_file, start=None, end=None, level=None, contains=None):
+    """Yield matching records across every rotated and active file of log_file"""
+    for path in log_files(log_directory, log_file):
+        yield from query_file(path, start, end, level, contains)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query or index rotated log files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    query = commands.add_parser("query", help="print matching records")
+    query.add_argument("--dir", default="logs")
+    query.add_argument("--file", default="app.log")
+    query.add_argument("--start")
+    query.add_argument("--end")
+    query.add_argument("--level")
+    query.add_argument("--contains")
+    index = commands.add_parser("index", help="build sidecar indexes for plain rotated files")
+    index.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        for path in args.paths:
+            if file_codec(path) == "plain":
+                write_index(path)
+        return
+    for record in query_logs(args.dir, args.file, args.start, args.end, args.level, args.contains):
+        sys.stdout.write(record + "\n")
+
+
+if __name__ == "__main__":
+    main()
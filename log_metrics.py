@@ -0,0 +1,294 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+EMIT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+DURATION_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram in seconds; callers serialize updates"""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self):
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+def _file_size(handler):
+    stream = handler.stream
+    if stream is None:
+        return 0
+    try:
+        return os.fstat(stream.fileno()).st_size
+    except (OSError, ValueError):
+        return 0
+
+
+class HandlerMetrics:
+    __slots__ = ("records", "emit", "bytes_written", "errors", "rollover", "file_handler", "file_offset")
+
+    def __init__(self):
+        self.records = defaultdict(int)
+        self.emit = Histogram(EMIT_BUCKETS)
+        # Bytes in files already rotated away; the current file is added at snapshot time
+        self.bytes_written = 0
+        self.errors = 0
+        self.rollover = Histogram(DURATION_BUCKETS)
+        self.file_handler = None
+        self.file_offset = 0
+
+    def total_bytes(self):
+        if self.file_handler is None:
+            return self.bytes_written
+        return self.bytes_written + max(_file_size(self.file_handler) - self.file_offset, 0)
+
+
+class LoggingMetrics:
+    """Counters and histograms for the handlers installed by setup_logging
+
+    instrument_handler() wraps a handler's emit (records per level and
+    emit latency), handleError and doRollover on the instance, and tracks
+    bytes written by file handlers. sanitize_record and LogCleaner report
+    through observe_sanitize() and observe_cleanup(). Latency histograms
+    sample one record in every sample_every (a power of two) to keep the
+    per-record cost low; record counters are exact.
+    Counters that handlers already keep (queue and Mongo drops, throttle
+    suppression) are read at snapshot time through register_source(), so
+    they cost nothing per record.
+    """
+    def __init__(self, sample_every=16):
+        self.enabled = False
+        self.sample_every = sample_every
+        self._sanitize_seen = 0
+        self.started = time.time()
+        self.handlers = {}
+        self.sanitize = Histogram(EMIT_BUCKETS)
+        self.cleanup = Histogram(DURATION_BUCKETS)
+        self.cleanup_deleted = 0
+        self._sources = {}
+        self._last_rates = None
+        self._lock = threading.Lock()
+
+    def _handler(self, name):
+        with self._lock:
+            return self.handlers.setdefault(name, HandlerMetrics())
+
+    def instrument_handler(self, handler, name):
+        """Count and time everything handler does under the label name
+
+        Every record is counted; emit latency is timed for one record in
+        every sample_every. Handler.handle already holds the handler's lock
+        around emit (and so around handleError and doRollover), so the
+        per-handler counters need no other lock. Bytes written are read
+        from the file size at snapshot time instead of per record.
+        """
+        stats = self._handler(name)
+        records, emit_histogram, bounds = stats.records, stats.emit, stats.emit.bounds
+        buckets = emit_histogram.counts
+        clock = time.perf_counter
+        mask = self.sample_every - 1
+        emit, handle_error = handler.emit, handler.handleError
+        seen = itertools.count(1)
+
+        def timed_emit(record):
+            records[record.levelno] += 1
+            if next(seen) & mask:
+                return emit(record)
+            start = clock()
+            try:
+                emit(record)
+            finally:
+                elapsed = clock() - start
+                buckets[bisect_left(bounds, elapsed)] += 1
+                emit_histogram.sum += elapsed
+                emit_histogram.count += 1
+
+        def counting_handle_error(record):
+            stats.errors += 1
+            handle_error(record)
+
+        handler.emit = timed_emit
+        handler.handleError = counting_handle_error
+
+        if isinstance(handler, logging.FileHandler):
+            stats.file_handler = handler
+            stats.file_offset = _file_size(handler)
+
+        if hasattr(handler, "doRollover"):
+            do_rollover = handler.doRollover
+
+            def timed_rollover():
+                start = clock()
+                if stats.file_handler is not None:
+                    handler.flush()
+                    stats.bytes_written += max(_file_size(handler) - stats.file_offset, 0)
+                    stats.file_offset = 0
+                try:
+                    do_rollover()
+                finally:
+                    stats.rollover.observe(clock() - start)
+
+            handler.doRollover = timed_rollover
+        return handler
+
+    def register_source(self, name, source, counters):
+        """Report source.<counter> as logging_<name>_<counter>_total"""
+        with self._lock:
+            self._sources[name] = (source, tuple(counters))
+
+    def sample_sanitize(self):
+        """Whether to time this record's sanitization (one in sample_every)"""
+        self._sanitize_seen += 1
+        return not self._sanitize_seen & (self.sample_every - 1)
+
+    def observe_sanitize(self, seconds):
+        with self._lock:
+            self.sanitize.observe(seconds)
+
+    def observe_cleanup(self, seconds, deleted):
+        with self._lock:
+            self.cleanup.observe(seconds)
+            self.cleanup_deleted += deleted
+
+    def snapshot(self, rates=True):
+        """Point-in-time copy of every metric as plain dicts
+
+        With rates, records_per_sec is measured since the previous
+        snapshot(rates=True) call (or since startup for the first one).
+        """
+        now = time.time()
+        with self._lock:
+            handlers = {
+                name: {
+                    "records": {logging.getLevelName(level): count for level, count in dict(stats.records).items()},
+                    "emit_seconds": stats.emit.as_dict(),
+                    "bytes_written": stats.total_bytes(),
+                    "errors": stats.errors,
+                    "rollover_seconds": stats.rollover.as_dict(),
+                }
+                for name, stats in self.handlers.items()
+            }
+            sanitize = self.sanitize.as_dict()
+            cleanup = self.cleanup.as_dict()
+            cleanup_deleted = self.cleanup_deleted
+            sources = dict(self._sources)
+            if rates:
+                previous_time, previous = self._last_rates or (self.started, {})
+                self._last_rates = (now, {name: dict(h["records"]) for name, h in handlers.items()})
+
+        if rates:
+            interval = max(now - previous_time, 1e-9)
+            for name, stats in handlers.items():
+                before = previous.get(name, {})
+                stats["records_per_sec"] = {level: (count - before.get(level, 0)) / interval
+                                            for level, count in stats["records"].items()}
+        return {
+            "uptime_seconds": now - self.started,
+            "handlers": handlers,
+            "sanitize_seconds": sanitize,
+            "cleanup_seconds": cleanup,
+            "cleanup_deleted_files": cleanup_deleted,
+            "counters": {f"{name}_{counter}": getattr(source, counter, 0)
+                         for name, (source, counters) in sources.items() for counter in counters},
+        }
+
+    def reset(self):
+        with self._lock:
+            self.handlers.clear()
+            self.sanitize = Histogram(EMIT_BUCKETS)
+            self.cleanup = Histogram(DURATION_BUCKETS)
+            self.cleanup_deleted = 0
+            self._sources.clear()
+            self._last_rates = None
+
+
+def _histogram_lines(name, histogram, labels=""):
+    lines = []
+    separator = "," if labels else ""
+    for bound, count in histogram["buckets"].items():
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram['sum']!r}")
+    lines.append(f"{name}_count{suffix} {histogram['count']}")
+    return lines
+
+
+def prometheus_text(registry=None):
+    """Metrics in the Prometheus text exposition format
+
+    For example, in a FastAPI app:
+
+        @app.get("/metrics")
+        def logging_metrics():
+            return Response(prometheus_text(), media_type=PROMETHEUS_CONTENT_TYPE)
+    """
+    # Prometheus derives rates from the counters itself
+    snap = (registry or metrics).snapshot(rates=False)
+    handlers = snap["handlers"]
+    lines = [
+        "# HELP logging_records_total Records emitted per handler and level.",
+        "# TYPE logging_records_total counter",
+    ]
+    for name, stats in handlers.items():
+        for level, count in stats["records"].items():
+            lines.append(f'logging_records_total{{handler="{name}",level="{level}"}} {count}')
+
+    lines += ["# HELP logging_emit_seconds Time spent in each handler's emit (sampled).",
+              "# TYPE logging_emit_seconds histogram"]
+    for name, stats in handlers.items():
+        lines += _histogram_lines("logging_emit_seconds", stats["emit_seconds"], f'handler="{name}"')
+
+    lines += ["# HELP logging_bytes_written_total Bytes written by file handlers.",
+              "# TYPE logging_bytes_written_total counter"]
+    for name, stats in handlers.items():
+        if stats["bytes_written"]:
+            lines.append(f'logging_bytes_written_total{{handler="{name}"}} {stats["bytes_written"]}')
+
+    lines += ["# HELP logging_handler_errors_total Records a handler failed to emit.",
+              "# TYPE logging_handler_errors_total counter"]
+    for name, stats in handlers.items():
+        lines.append(f'logging_handler_errors_total{{handler="{name}"}} {stats["errors"]}')
+
+    lines += ["# HELP logging_rollover_seconds Duration of file rollovers.",
+              "# TYPE logging_rollover_seconds histogram"]
+    for name, stats in handlers.items():
+        if stats["rollover_seconds"]["count"]:
+            lines += _histogram_lines("logging_rollover_seconds", stats["rollover_seconds"], f'handler="{name}"')
+
+    lines += ["# HELP logging_sanitize_seconds Time spent sanitizing a record (sampled).",
+              "# TYPE logging_sanitize_seconds histogram"]
+    lines += _histogram_lines("logging_sanitize_seconds", snap["sanitize_seconds"])
+    lines += ["# HELP logging_cleanup_seconds Duration of LogCleaner retention passes.",
+              "# TYPE logging_cleanup_seconds histogram"]
+    lines += _histogram_lines("logging_cleanup_seconds", snap["cleanup_seconds"])
+    lines += ["# HELP logging_cleanup_deleted_files_total Rotated files deleted by LogCleaner.",
+              "# TYPE logging_cleanup_deleted_files_total counter",
+              f"logging_cleanup_deleted_files_total {snap['cleanup_deleted_files']}"]
+
+    for name, value in snap["counters"].items():
+        lines += [f"# TYPE logging_{name}_total counter", f"logging_{name}_total {value}"]
+    return "\n".join(lines) + "\n"
+
+
+# Singleton registry used by setup_logging
+metrics = LoggingMetrics()
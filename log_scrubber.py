@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .log_index import (block_compressor, file_codec, index_path, iter_chunks, log_files,
+                        read_errors, record_at, write_chunks)
+from .sensitive_info import SecurityUtils
+
+SCRUB_SUFFIX = ".scrub.tmp"
+
+
+def scrub_state_path(log_directory, log_file):
+    # Named so it never matches "<log_file>.*" (see _mongo_spill_path in log_config)
+    return os.path.join(log_directory, f"scrub-state-{log_file}.json")
+
+
+def _candidates(sensitive_uris):
+    """Pattern for anything a redaction rule could match, searched in lowercased bytes
+
+    A flat alternation where every branch starts with a literal lets the
+    regex engine skip ahead on first bytes; it runs several times faster
+    than the rules themselves.
+    """
+    needles = [b"://"] + [re.escape(key.lower().encode("utf-8")) + rb"\s*[=:]"
+                          for key in SecurityUtils.REDACTION_KEYS]
+    secrets = list(sensitive_uris or ()) + SecurityUtils.KNOWN_SECRETS
+    needles += [re.escape(secret.lower().encode("utf-8")) for secret in secrets if secret]
+    return re.compile(b"|".join(needles))
+
+
+def _scrub_chunk(data, candidates, sensitive_uris):
+    """data with sanitize_error_message applied to the message of every record that needs it
+
+    Only records containing "key=", "key:", "://", one of the URIs or a
+    registered secret are decoded and sanitized; the rest is copied as bytes.
+    """
+    lowered = data.lower()
+    match = candidates.search(lowered)
+    parts, copied = [], 0
+    while match is not None:
+        start, message_start, end = record_at(data, match.start())
+        message = data[message_start:end].decode("utf-8", "surrogateescape")
+        sanitized = SecurityUtils.sanitize_error_message(message, sensitive_uris)
+        if sanitized != message:
+            parts += [data[copied:message_start], sanitized.encode("utf-8", "surrogateescape")]
+            copied = end
+        match = candidates.search(lowered, end)
+    if not parts:
+        return data
+    parts.append(data[copied:])
+    return b"".join(parts)
+
+
+def scrub_file(path, sensitive_uris=None):
+    """Rewrite path with its secrets redacted; returns (bytes read, CPU seconds, changed)
+
+    The file is read in record-aligned chunks (mapped if plain, streamed if
+    .gz/.zst) and scanned without writing anything until a chunk needs
+    redacting, so a clean archive costs one read. Only then is it
+    rewritten next to itself, compressed the same way as blocks with a
+    fresh sidecar index, and swapped in with os.replace, keeping its mtime
+    and mode.
+    """
+    started = time.process_time()
+    codec = file_codec(path)
+    stat = os.stat(path)
+    candidates = _candidates(sensitive_uris)
+    read = _clean_prefix(path, candidates, sensitive_uris)
+    if read is not None:
+        return read, time.process_time() - started, False
+    # Per process, so a worker orphaned by a killed run can't clobber a new run's file
+    partial = f"{path}.{os.getpid()}{SCRUB_SUFFIX}"
+    read = changed = 0
+
+    def scrubbed():
+        nonlocal read, changed
+        for chunk in iter_chunks(path):
+            read += len(chunk)
+            clean = _scrub_chunk(chunk, candidates, sensitive_uris)
+            changed = changed or clean is not chunk
+            yield clean
+
+    try:
+        with open(partial, "wb") as raw:
+            index = write_chunks(scrubbed(), raw, codec, block_compressor(codec, stat.st_mtime))
+            if changed:
+                raw.flush()
+                os.fsync(raw.fileno())
+        current = os.stat(path)
+        if not changed or (current.st_ino, current.st_size, current.st_mtime_ns) != \
+                (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            # Nothing to redact, or the file was archived or rewritten meanwhile
+            os.remove(partial)
+            return read, time.process_time() - started, False
+        os.chmod(partial, stat.st_mode)
+        os.utime(partial, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        # The old index points into the old bytes
+        if os.path.exists(index_path(path)):
+            os.remove(index_path(path))
+        os.replace(partial, path)
+        index.save(path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return read, time.process_time() - started, True
+
+
+def _clean_prefix(path, candidates, sensitive_uris):
+    """Bytes in path if no chunk needs redacting, else None (stops at the first one)"""
+    read = 0
+    chunks = iter_chunks(path)
+    try:
+        for chunk in chunks:
+            if _scrub_chunk(chunk, candidates, sensitive_uris) is not chunk:
+                return None
+            read += len(chunk)
+    finally:
+        chunks.close()
+    return read
+
+
+def _init_worker(redaction_keys, known_secrets):
+    # Workers may be spawned rather than forked; use the caller's rules
+    SecurityUtils.REDACTION_KEYS = redaction_keys
+    SecurityUtils.KNOWN_SECRETS = known_secrets
+
+
+def _rules_fingerprint(sensitive_uris):
+    # Hashed so the state file never holds the URIs or secrets themselves
+    rules = json.dumps([SecurityUtils.REDACTION_KEYS, sorted(uri for uri in sensitive_uris or () if uri),
+                        sorted(SecurityUtils.KNOWN_SECRETS)])
+    return hashlib.sha256(rules.encode("utf-8")).hexdigest()
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _load_state(state_path, fingerprint):
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("rules") == fingerprint:
+            return state["done"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def _save_state(state_path, fingerprint, done, failed):
+    partial = state_path + ".tmp"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump({"rules": fingerprint, "done": done, "failed": failed}, f)
+    os.replace(partial, state_path)
+
+
+def scrub_logs(log_directory, log_file, sensitive_uris=None, workers=None, include_active=False):
+    """Redact secrets from every rotated file of log_file, one file per core
+
+    Registered SecurityUtils.KNOWN_SECRETS are masked too. Files already
+    scrubbed under the current REDACTION_KEYS, secrets and URIs are
+    recorded in scrub_state_path(), so an interrupted run picks up where it
+    left off and later runs only touch new or changed files. The active
+    file is skipped unless include_active (its handler keeps writing to the
+    replaced inode otherwise). A file that can't be read (a truncated or
+    corrupt archive, say) counts as an error and is listed under "failed"
+    in the state file with its error; the next run tries it again.
+
+    Returns files, changed, skipped, errors, bytes (uncompressed),
+    seconds, mb_per_sec and mb_per_sec_per_core (bytes over the CPU time
+    the workers spent).
+    """
+    started = time.perf_counter()
+    fingerprint = _rules_fingerprint(sensitive_uris)
+    state_path = scrub_state_path(log_directory, log_file)
+    done = _load_state(state_path, fingerprint)
+
+    prefix = log_file + "."
+    for name in os.listdir(log_directory):
+        if name.startswith(prefix) and name.endswith(SCRUB_SUFFIX):
+            os.remove(os.path.join(log_directory, name))  # left by an interrupted run
+
+    active = os.path.join(log_directory, log_file)
+    paths = [path for path in log_files(log_directory, log_file) if include_active or path != active]
+    present = {os.path.basename(path) for path in paths}
+    done = {name: signature for name, signature in done.items() if name in present}
+    pending = [path for path in paths if done.get(os.path.basename(path)) != _signature(path)]
+
+    result = {"files": len(pending), "changed": 0, "skipped": len(paths) - len(pending),
+              "errors": 0, "bytes": 0, "seconds": 0.0}
+    busy = 0.0
+    failed = {}
+    if pending:
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        errors = read_errors()
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(list(SecurityUtils.REDACTION_KEYS),
+                                           list(SecurityUtils.KNOWN_SECRETS))) as executor:
+            futures = {executor.submit(scrub_file, path, sensitive_uris): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    read, seconds, changed = future.result()
+                    done[os.path.basename(path)] = _signature(path)
+                except errors as e:
+                    print(f"Error scrubbing log file {path}: {e}", file=sys.stderr)
+                    failed[os.path.basename(path)] = f"{type(e).__name__}: {e}"
+                    result["errors"] += 1
+                    _save_state(state_path, fingerprint, done, failed)
+                    continue
+                result["bytes"] += read
+                result["changed"] += changed
+                busy += seconds
+                _save_state(state_path, fingerprint, done, failed)
+    else:
+        _save_state(state_path, fingerprint, done, failed)
+
+    result["seconds"] = time.perf_counter() - started
+    result["mb_per_sec"] = result["bytes"] / 1e6 / max(result["seconds"], 1e-9)
+    result["mb_per_sec_per_core"] = result["bytes"] / 1e6 / busy if busy else 0.0
+    return result
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Redact secrets from rotated log files in place")
+    parser.add_argument("--dir", default="logs")
+    parser.add_argument("--file", default="app.log")
+    parser.add_argument("--uri", action="append", default=[], help="known secret URI (repeatable)")
+    parser.add_argument("--key", action="append", default=[], help="extra redaction key (repeatable)")
+    parser.add_argument("--secret", action="append", default=[], help="known secret value (repeatable)")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--include-active", action="store_true")
+    args = parser.parse_args(argv)
+
+    SecurityUtils.REDACTION_KEYS = SecurityUtils.REDACTION_KEYS + [key for key in args.key
+                                                                   if key not in SecurityUtils.REDACTION_KEYS]
+    SecurityUtils.register_secrets(*args.secret)
+    result = scrub_logs(args.dir, args.file, args.uri, args.workers, args.include_active)
+    sys.stdout.write(
+        f"{result['files']} files scrubbed ({result['changed']} changed, {result['skipped']} already clean, "
+        f"{result['errors']} errors): {result['bytes'] / 1e6:,.0f}MB in {result['seconds']:.1f}s, "
+        f"{result['mb_per_sec']:.1f}MB/s, {result['mb_per_sec_per_core']:.1f}MB/s per core\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
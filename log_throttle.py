@@ -0,0 +1,134 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+class ThrottlingFilter(logging.Filter):
+    """Burst suppression and sampling for hot log statements
+
+    Records are grouped by logger, level and message template (record.msg,
+    before %-formatting). In each window of window seconds the first burst
+    records of a group pass; the rest are dropped and counted, and once the
+    window is over a single "Suppressed K similar records" record is logged
+    in their place. sample_rates maps logger names (and their children) to
+    the fraction of records at or below sample_level to keep.
+
+    At most max_templates groups are tracked; the least recently used one
+    is evicted (after logging its summary) to keep memory bounded.
+
+    The decision is cached on the record as record.throttled, so one filter
+    can be shared by several handlers without counting a record twice.
+    """
+    def __init__(self, window=1.0, burst=10, max_templates=10000,
+                 sample_rates=None, sample_level=logging.INFO):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.max_templates = max_templates
+        self.sample_rates = dict(sample_rates or {})
+        self.sample_level = sample_level
+        self.suppressed = 0
+        self.sampled_out = 0
+        # key -> [window_start, count, suppressed, (source fields of the first record)]
+        self._templates = OrderedDict()
+        self._overflowing = {}
+        self._rates = {}
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _sample_rate(self, name):
+        rate = self._rates.get(name)
+        if rate is None:
+            rate = 1.0
+            parts = name.split(".")
+            for end in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:end])
+                if prefix in self.sample_rates:
+                    rate = self.sample_rates[prefix]
+                    break
+            self._rates[name] = rate
+        return rate
+
+    def filter(self, record):
+        throttled = getattr(record, "throttled", None)
+        if throttled is not None:
+            return not throttled
+        if getattr(record, "throttle_summary", False):
+            return True
+
+        if record.levelno <= self.sample_level and self.sample_rates:
+            rate = self._sample_rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                self.sampled_out += 1
+                record.throttled = True
+                return False
+
+        now = time.monotonic()
+        template = record.msg if isinstance(record.msg, str) else str(record.msg)
+        key = (record.name, record.levelno, template)
+        summaries = []
+        with self._lock:
+            entry = self._templates.get(key)
+            if entry is None:
+                source = (record.name, record.levelno, record.levelname, record.pathname,
+                          record.filename, record.module, record.lineno, record.funcName, template)
+                entry = self._templates[key] = [now, 0, 0, source]
+                if len(self._templates) > self.max_templates:
+                    evicted_key, evicted = self._templates.popitem(last=False)
+                    self._overflowing.pop(evicted_key, None)
+                    if evicted[2]:
+                        summaries.append(evicted)
+            else:
+                self._templates.move_to_end(key)
+                if now - entry[0] >= self.window:
+                    if entry[2]:
+                        self._overflowing.pop(key, None)
+                        summaries.append(list(entry))
+                    entry[0], entry[1], entry[2] = now, 0, 0
+
+            entry[1] += 1
+            throttled = entry[1] > self.burst
+            if throttled:
+                entry[2] += 1
+                self._overflowing[key] = entry
+                self.suppressed += 1
+
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.window
+                summaries.extend(self._expired(now))
+
+        record.throttled = throttled
+        for summary in summaries:
+            self._log_summary(summary)
+        return not throttled
+
+    def _expired(self, now, force=False):
+        """Close the windows that ended with suppressed records (lock held)"""
+        expired = []
+        for key, entry in list(self._overflowing.items()):
+            if force or now - entry[0] >= self.window:
+                del self._overflowing[key]
+                expired.append(list(entry))
+                entry[0], entry[1], entry[2] = now, 0, 0
+        return expired
+
+    def flush(self):
+        """Log summaries for every group with suppressed records"""
+        with self._lock:
+            summaries = self._expired(time.monotonic(), force=True)
+        for summary in summaries:
+            self._log_summary(summary)
+
+    def _log_summary(self, entry):
+        _, _, suppressed, source = entry
+        name, levelno, levelname, pathname, filename, module, lineno, func_name, template = source
+        summary = logging.makeLogRecord({
+            "name": name, "levelno": levelno, "levelname": levelname,
+            "pathname": pathname, "filename": filename, "module": module,
+            "lineno": lineno, "funcName": func_name,
+            "msg": f"Suppressed {suppressed} similar records: {template}",
+            "throttle_summary": True,
+        })
+        logging.getLogger(name).handle(summary)
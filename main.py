@@ -56,8 +56,8 @@ logger = safe_setup_logging()
 
 # Test logging immediately
 logger.info("Application starting up...")
-logger.info(f"Log directory: {getattr(settings, 'LOG_DIRECTORY', 'logs')}")
-logger.info(f"Log file: {getattr(settings, 'LOG_FILE', 'app.log')}")
+logger.info("Log directory: %s", getattr(settings, 'LOG_DIRECTORY', 'logs'))
+logger.info("Log file: %s", getattr(settings, 'LOG_FILE', 'app.log'))
 
 
 logging.basicConfig(
@@ -0,0 +1,446 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Collection suffix per partition granularity, in UTC
+PARTITION_FORMATS = {"day": "%Y%m%d", "hour": "%Y%m%d%H"}
+# Created on every collection the handler writes to
+LOG_INDEXES = (("timestamp",), ("level", "timestamp"), ("logger", "timestamp"))
+LEVEL_NAMES = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+
+class MongoHandler(logging.Handler):
+    """Buffered MongoDB log handler
+
+    Records are buffered in memory and written with insert_many once
+    batch_size records are waiting or flush_interval seconds have passed.
+    A background thread does the writes, so emit() never waits on MongoDB.
+    If a write fails the batch is appended to spill_path (JSON lines) and
+    replayed once MongoDB accepts writes again.
+
+    With background_connect the constructor returns at once and the
+    flusher thread connects; records are buffered meanwhile. If MongoDB
+    cannot be reached within connect_timeout the handler degrades like a
+    failed write: records go to spill_path (or are counted as dropped)
+    and the connection is retried every retry_interval seconds. Spilled
+    lines that no longer parse (torn by a crash mid-write) are moved to
+    spill_path + ".bad" and counted as dropped. on_connect,
+    if set, is called from the flusher thread once that connection
+    succeeds, with no lock held (setup_logging uses it to run partition
+    retention, which logs).
+
+    With partition ("day" or "hour") each record goes to
+    <collection_name>_<YYYYMMDD[HH]> for its UTC timestamp, so retention
+    drops whole collections (drop_partitions_before, run by LogCleaner)
+    instead of deleting documents. ttl_days adds a TTL index so MongoDB
+    expires records itself. Indexes on timestamp, level and logger are
+    created on each collection before its first write. Context values that
+    BSON can't hold (dates, sets, arbitrary objects, huge ints) are stored
+    as their str().
+    """
+    def __init__(self, mongo_uri, db_name, collection_name, batch_size=100,
+                 flush_interval=2.0, spill_path=None, max_buffer=10000,
+                 retry_interval=30.0, collection=None, background_connect=False,
+                 connect_timeout=5.0, partition=None, ttl_days=None):
+        if partition is not None and partition not in PARTITION_FORMATS:
+            raise ValueError(f"Unknown partition {partition!r}, expected one of {tuple(PARTITION_FORMATS)}")
+        super().__init__()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.max_buffer = max_buffer
+        self.retry_interval = retry_interval
+        self.connect_timeout = connect_timeout
+        self.partition = partition
+        self.ttl_days = ttl_days
+        self.client = None
+        self.on_connect = None
+        self._target = (mongo_uri, db_name, collection_name)
+        self._indexed = set()
+        self.collection = collection
+        if collection is None and not background_connect:
+            self._connect()
+
+        self.inserted = 0
+        self.spilled = 0
+        self.dropped = 0
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._retry_at = 0.0
+        self._new_connection = False
+        self._closed = False
+        self._flusher = threading.Thread(target=self._run_flusher, name="mongo-log-flusher", daemon=True)
+        if self.collection is None:
+            self._wakeup.set()  # connect straight away rather than after flush_interval
+        self._flusher.start()
+
+    @property
+    def connected(self):
+        return self.collection is not None
+
+    def _connect(self):
+        # pymongo takes longer to import than the rest of the package; only pay for it here
+        from pymongo import MongoClient
+
+        mongo_uri, db_name, collection_name = self._target
+        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=int(self.connect_timeout * 1000))
+        try:
+            client.admin.command("ping")
+        except Exception:
+            client.close()
+            raise
+        self.client = client
+        self.collection = client[db_name][collection_name]
+
+    def _try_connect(self):
+        from pymongo.errors import PyMongoError
+
+        try:
+            self._connect()
+        except PyMongoError:
+            self._retry_at = time.monotonic() + self.retry_interval
+            return False
+        # Called by the flusher once _io_lock is released: on_connect may log,
+        # and logging.shutdown() holds this handler's lock while flush() waits on _io_lock
+        self._new_connection = True
+        return True
+
+    def _to_document(self, record):
+        document = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": self.format(record),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        context = getattr(record, "context", None)
+        if context is not None and hasattr(context, "as_dict"):
+            document["context"] = _bson_safe(context.as_dict())
+        return document
+
+    def emit(self, record):
+        try:
+            document = self._to_document(record)
+            with self._buffer_lock:
+                self._buffer.append(document)
+                pending = len(self._buffer)
+            if pending >= self.batch_size:
+                self._wakeup.set()
+            if pending >= self.max_buffer:
+                # The flusher is stuck on a slow server; move the backlog to disk
+                self._spill(self._take_buffer())
+        except Exception:
+            self.handleError(record)
+
+    def _take_buffer(self):
+        with self._buffer_lock:
+            documents, self._buffer = self._buffer, []
+        return documents
+
+    def _run_flusher(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Whatever went wrong, later records still need a flusher
+                print(f"Error flushing MongoDB log records: {e}", file=sys.stderr)
+            if self._new_connection:
+                self._new_connection = False
+                if self.on_connect is not None:
+                    try:
+                        self.on_connect()
+                    except Exception as e:
+                        print(f"Error in MongoDB on_connect callback: {e}", file=sys.stderr)
+
+    def flush(self):
+        """Write buffered records, replaying any spilled ones first
+
+        Only the flusher thread connects: called from anywhere else before
+        the connection is up, flush() spills the buffer rather than wait up
+        to connect_timeout for the flusher (logging.shutdown() calls it at exit).
+        """
+        if self.collection is None and threading.current_thread() is not self._flusher:
+            self._spill(self._take_buffer())
+            return
+        with self._io_lock:
+            documents = self._take_buffer()
+            if time.monotonic() < self._retry_at:
+                self._spill(documents)
+                return
+            if self.collection is None and not self._try_connect():
+                self._spill(documents)
+                return
+            if not self._replay_spill():
+                self._spill(documents)
+                return
+            for start in range(0, len(documents), self.batch_size):
+                batch = documents[start:start + self.batch_size]
+                if not self._insert(batch):
+                    self._spill(documents[start:])
+                    return
+
+    def _insert(self, documents):
+        from pymongo.errors import PyMongoError
+
+        if not documents:
+            return True
+        try:
+            for collection, group in self._partitioned(documents):
+                self._ensure_indexes(collection)
+                try:
+                    collection.insert_many(group, ordered=False)
+                except PyMongoError:
+                    raise
+                except Exception as e:
+                    # A batch that can't be encoded fails the same way on every retry
+                    print(f"Error encoding {len(group)} MongoDB log records, dropping them: {e}",
+                          file=sys.stderr)
+                    self.dropped += len(group)
+                    continue
+                self.inserted += len(group)
+            return True
+        except PyMongoError:
+            self._retry_at = time.monotonic() + self.retry_interval
+            return False
+
+    def _partitioned(self, documents):
+        if self.partition is None:
+            return [(self.collection, documents)]
+        groups = {}
+        suffix = PARTITION_FORMATS[self.partition]
+        for document in documents:
+            groups.setdefault(document["timestamp"].strftime(suffix), []).append(document)
+        database, base = self.collection.database, self.collection.name
+        return [(database[f"{base}_{key}"], group) for key, group in groups.items()]
+
+    def _ensure_indexes(self, collection):
+        from pymongo.errors import OperationFailure
+
+        if collection.name in self._indexed:
+            return
+        for keys in LOG_INDEXES:
+            try:
+                if keys == ("timestamp",) and self.ttl_days:
+                    self._ensure_ttl_index(collection)
+                else:
+                    collection.create_index([(key, 1) for key in keys])
+            except OperationFailure as e:
+                # A conflicting index built by someone else; writes and queries still work
+                print(f"Error creating index {keys} on {collection.name}: {e}", file=sys.stderr)
+        self._indexed.add(collection.name)
+
+    def _ensure_ttl_index(self, collection):
+        from pymongo.errors import OperationFailure
+
+        seconds = int(self.ttl_days * 86400)
+        try:
+            collection.create_index("timestamp", expireAfterSeconds=seconds)
+        except OperationFailure:
+            # ttl_days changed since the index was built
+            collection.database.command({"collMod": collection.name,
+                                         "index": {"keyPattern": {"timestamp": 1}, "expireAfterSeconds": seconds}})
+
+    def drop_partitions_before(self, cutoff):
+        """Drop the partitions that end before cutoff (a datetime or epoch seconds)
+
+        Returns the dropped collection names; does nothing until connected
+        or without partition.
+        """
+        if self.partition is None or self.collection is None:
+            return []
+        return drop_partitions(self.collection.database, self.collection.name, cutoff)
+
+    def _spill(self, documents):
+        if not documents:
+            return
+        if not self.spill_path:
+            self.dropped += len(documents)
+            return
+        # insert_many may have assigned _id before failing; replay gets fresh ids
+        data = "".join(
+            json.dumps({k: v for k, v in document.items() if k != "_id"}, default=_encode_datetime) + "\n"
+            for document in documents
+        ).encode("utf-8")
+        try:
+            with self._spill_lock, open(self.spill_path, "a+b") as spill:
+                end = spill.seek(0, os.SEEK_END)
+                if end:
+                    spill.seek(end - 1)
+                    if spill.read(1) != b"\n":
+                        # End a line torn by a crash so it doesn't swallow the first record
+                        data = b"\n" + data
+                spill.write(data)
+        except OSError as e:
+            print(f"Error writing MongoDB spill file {self.spill_path}: {e}", file=sys.stderr)
+            self.dropped += len(documents)
+            return
+        self.spilled += len(documents)
+
+    def _replay_spill(self):
+        """Insert spilled records; returns False if MongoDB is still failing"""
+        if not self.spill_path:
+            return True
+        replay_path = self.spill_path + ".replay"
+        if not os.path.exists(replay_path):
+            if not os.path.exists(self.spill_path):
+                return True
+            with self._spill_lock:
+                os.replace(self.spill_path, replay_path)
+
+        failed = False
+        with open(replay_path, encoding="utf-8", errors="replace") as replay:
+            while not failed:
+                lines = list(itertools.islice(replay, self.batch_size))
+                if not lines:
+                    break
+                documents, lines = self._parse_spill(lines)
+                if not self._insert(documents):
+                    # Keep the unsent tail for the next attempt
+                    with open(replay_path + ".tmp", "w", encoding="utf-8") as remaining:
+                        remaining.writelines(lines)
+                        remaining.writelines(replay)
+                    failed = True
+        if failed:
+            os.replace(replay_path + ".tmp", replay_path)
+            return False
+        os.remove(replay_path)
+        # Replay anything spilled while this file was being sent
+        return self._replay_spill()
+
+    def _parse_spill(self, lines):
+        """(documents, their lines) for the spilled lines that parse"""
+        documents, good, bad = [], [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                documents.append(json.loads(line, object_hook=_decode_datetime))
+                good.append(line)
+            except ValueError:
+                bad.append(line if line.endswith("\n") else line + "\n")
+        if bad:
+            # Retrying a torn line can never succeed; keep it for inspection instead
+            with open(self.spill_path + ".bad", "a", encoding="utf-8") as quarantine:
+                quarantine.writelines(bad)
+            self.dropped += len(bad)
+        return documents, good
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self.collection is not None:
+            self._flusher.join(timeout=self.flush_interval + 1.0)
+        self.flush()
+        if self.client is not None:
+            self.client.close()
+        super().close()
+
+
+def _utc(value):
+    """Naive UTC datetime (as MongoDB returns them) from a datetime or epoch seconds"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def log_partitions(database, collection_name):
+    """(start, end, name) of every partition of collection_name, oldest first"""
+    pattern = re.compile(rf"{re.escape(collection_name)}_(\d{{8}}|\d{{10}})")
+    partitions = []
+    for name in database.list_collection_names():
+        match = pattern.fullmatch(name)
+        if match is None:
+            continue
+        suffix = match.group(1)
+        if len(suffix) == 8:
+            start, span = datetime.strptime(suffix, PARTITION_FORMATS["day"]), timedelta(days=1)
+        else:
+            start, span = datetime.strptime(suffix, PARTITION_FORMATS["hour"]), timedelta(hours=1)
+        partitions.append((start, start + span, name))
+    partitions.sort()
+    return partitions
+
+
+def drop_partitions(database, collection_name, cutoff):
+    """Drop the partitions of collection_name that end before cutoff; returns their names"""
+    cutoff = _utc(cutoff)
+    dropped = []
+    for _, end, name in log_partitions(database, collection_name):
+        if end <= cutoff:
+            database.drop_collection(name)
+            dropped.append(name)
+    return dropped
+
+
+def query_mongo_logs(database, collection_name, start=None, end=None, level=None, logger=None,
+                     query=None):
+    """Yield the log documents between start and end (inclusive), oldest first
+
+    The time range is fanned out over the partitions that overlap it, one
+    at a time, and merged with the unpartitioned collection_name itself
+    (written before partitioning was enabled, or with ttl_days). level is a
+    minimum level, logger matches that logger and its children, and query
+    adds any other filter.
+    """
+    start = _utc(start) if start is not None else None
+    end = _utc(end) if end is not None else None
+    conditions = dict(query or {})
+    if start is not None or end is not None:
+        conditions["timestamp"] = {key: value for key, value in (("$gte", start), ("$lte", end))
+                                   if value is not None}
+    if level is not None:
+        levelno = level if isinstance(level, int) else logging.getLevelName(level.upper())
+        conditions["level"] = {"$in": [name for name in LEVEL_NAMES if logging.getLevelName(name) >= levelno]}
+    if logger is not None:
+        conditions["logger"] = {"$regex": f"^{re.escape(logger)}(\\.|$)"}
+
+    def find(name):
+        return database[name].find(conditions).sort("timestamp", 1)
+
+    partitions = [name for first, last, name in log_partitions(database, collection_name)
+                  if (start is None or last > start) and (end is None or first <= end)]
+    streams = [itertools.chain.from_iterable(map(find, partitions))]
+    if collection_name in database.list_collection_names():
+        streams.append(find(collection_name))
+    return heapq.merge(*streams, key=lambda document: document["timestamp"])
+
+
+def _bson_safe(value):
+    """value with anything BSON or the spill file can't hold replaced by its str()"""
+    if value is None or isinstance(value, (bool, float, str, datetime)):
+        return value
+    if isinstance(value, int):
+        return value if -2 ** 63 <= value < 2 ** 63 else str(value)
+    if isinstance(value, dict):
+        return {str(key): _bson_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_bson_safe(item) for item in value]
+    return str(value)
+
+
+def _encode_datetime(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_datetime(value):
+    if len(value) == 1 and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
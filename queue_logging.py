@@ -0,0 +1,68 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+QUEUE_POLICIES = ("block", "drop_newest", "drop_by_level")
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler with a backpressure policy for when the queue is full
+
+    - block: wait for the listener to make room
+    - drop_newest: discard the incoming record
+    - drop_by_level: discard records below drop_level, block for the rest
+    """
+    def __init__(self, log_queue, policy="block", drop_level=logging.WARNING):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of {QUEUE_POLICIES}")
+        super().__init__(log_queue)
+        self.policy = policy
+        self.drop_level = drop_level
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.policy == "block":
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == "drop_by_level" and record.levelno >= self.drop_level:
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+
+class FlushingQueueListener(QueueListener):
+    """QueueListener that drains the queue and flushes its handlers on stop"""
+    def handle(self, record):
+        if not getattr(record, "flight_recorder", False):
+            return super().handle(record)
+        # Replayed context is below the handlers' levels on purpose
+        record = self.prepare(record)
+        for handler in self.handlers:
+            handler.handle(record)
+
+    def enqueue_sentinel(self):
+        # The default put_nowait fails on a full queue; wait so nothing is lost
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+
+def build_queue_pipeline(handlers, maxsize=10000, policy="block", drop_level=logging.WARNING):
+    """Create a started listener fanning records out to handlers, and the handler feeding it"""
+    log_queue = queue.Queue(maxsize=maxsize)
+    queue_handler = BoundedQueueHandler(log_queue, policy=policy, drop_level=drop_level)
+    listener = FlushingQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return queue_handler, listener
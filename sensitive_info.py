@@ -1,90 +1,336 @@
-import re
-from urllib.parse import urlparse, parse_qs, urlunparse
-
-class SecurityUtils:
-    SENSITIVE_KEYS = ['password', 'pass', 'pwd', 'secret', 'key', 'token', 'auth', 'uri', 'url']
-
-    @staticmethod
-    def sanitize_uri(uri: str) -> str:
-        """Sanitize URIs by masking credentials and sensitive query params"""
-        if not uri:
-            return "***"
-
-        try:
-            parsed = urlparse(uri)
-
-            # Mask username:password if present
-            netloc = parsed.hostname or ""
-            if parsed.username or parsed.password:
-                if parsed.port:
-                    netloc = f"***:***@{parsed.hostname}:{parsed.port}"
-                else:
-                    netloc = f"***:***@{parsed.hostname}"
-            elif parsed.port:
-                netloc = f"{parsed.hostname}:{parsed.port}"
-
-            # Mask sensitive query params
-            query_params = parse_qs(parsed.query)
-            masked_query = []
-            for k, v in query_params.items():
-                if any(sk in k.lower() for sk in SecurityUtils.SENSITIVE_KEYS):
-                    masked_query.append(f"{k}=***")
-                else:
-                    masked_query.append(f"{k}={v[0]}")
-            
-            parsed = parsed._replace(netloc=netloc, query="&".join(masked_query))
-            return urlunparse(parsed)
-
-        except Exception:
-            return "***"
-
-    @staticmethod
-    def sanitize_error_message(error_msg: str, sensitive_uris=None) -> str:
-        """Sanitize sensitive URIs, passwords, tokens in error messages"""
-        if not error_msg:
-            return error_msg
-
-        # Replace known URIs
-        if sensitive_uris:
-            for uri in sensitive_uris:
-                if uri:
-                    error_msg = error_msg.replace(uri, SecurityUtils.sanitize_uri(uri))
-
-        # Mask inline creds in URIs
-        error_msg = re.sub(r"://([^:]+):([^@]+)@", "://***:***@", error_msg)
-
-        # Mask sensitive key=value patterns
-        patterns = [
-            (r'\bpassword\s*[=:]\s*[^\s&]+', 'password=***'),
-            (r'\bpass\s*[=:]\s*[^\s&]+', 'pass=***'),
-            (r'\bpwd\s*[=:]\s*[^\s&]+', 'pwd=***'),
-            (r'\btoken\s*[=:]\s*[^\s&]+', 'token=***'),
-            (r'\bsecret\s*[=:]\s*[^\s&]+', 'secret=***'),
-            (r'\bkey\s*[=:]\s*[^\s&]+', 'key=***'),
-            (r'\bauth\s*[=:]\s*[^\s&]+', 'auth=***'),
-        ]
-        for pattern, replacement in patterns:
-            error_msg = re.sub(pattern, replacement, error_msg, flags=re.IGNORECASE)
-
-        return error_msg
-
-    @staticmethod
-    def sanitize_dict(data: dict, sensitive_keys=None) -> dict:
-        """Sanitize dictionary by masking sensitive keys recursively"""
-        if sensitive_keys is None:
-            sensitive_keys = SecurityUtils.SENSITIVE_KEYS
-
-        sanitized = {}
-        for key, value in data.items():
-            if any(sk in key.lower() for sk in sensitive_keys):
-                sanitized[key] = "***"
-            elif isinstance(value, dict):
-                sanitized[key] = SecurityUtils.sanitize_dict(value, sensitive_keys)
-            elif isinstance(value, list):
-                sanitized[key] = [
-                    SecurityUtils.sanitize_dict(item, sensitive_keys) if isinstance(item, dict) else "***" if isinstance(item, str) and any(sk in key.lower() for sk in sensitive_keys) else item
-                    for item in value
-                ]
-            else:
-                sanitized[key] = value
-        return sanitized
+import functools
+import itertools
+import re
+from urllib.parse import urlparse, parse_qs, urlunparse
+
+_INLINE_CREDS = r"://([^:]+):([^@]+)@"
+_INLINE_CREDS_RE = re.compile(_INLINE_CREDS)
+
+class SecurityUtils:
+    SENSITIVE_KEYS = ['password', 'pass', 'pwd', 'secret', 'key', 'token', 'auth', 'uri', 'url']
+    # Keys masked in free-text messages, in the order the rules are applied
+    REDACTION_KEYS = ['password', 'pass', 'pwd', 'token', 'secret', 'key', 'auth']
+    # Per-key verdicts remembered by each sensitive-key matcher
+    KEY_CACHE_SIZE = 4096
+    # Values masked wherever they appear in a message (see register_secrets)
+    KNOWN_SECRETS = []
+    _redactor = None
+    _secrets = None
+
+    @staticmethod
+    def is_sensitive_key(key, sensitive_keys=None) -> bool:
+        """True if any sensitive key is a substring of the lowercased key"""
+        if not isinstance(key, str):
+            return False
+        return SecurityUtils._key_matcher(sensitive_keys).matches(key)
+
+    @staticmethod
+    def _key_matcher(sensitive_keys=None):
+        if sensitive_keys is None:
+            sensitive_keys = SecurityUtils.SENSITIVE_KEYS
+        # Keyed on the current contents, so edits to the list rebuild the matcher
+        return _build_key_matcher(tuple(sensitive_keys), SecurityUtils.KEY_CACHE_SIZE)
+
+    @staticmethod
+    def sanitize_uri(uri: str) -> str:
+        """Sanitize URIs by masking credentials and sensitive query params"""
+        if not uri:
+            return "***"
+
+        try:
+            parsed = urlparse(uri)
+
+            # Mask username:password if present
+            netloc = parsed.hostname or ""
+            if parsed.username or parsed.password:
+                if parsed.port:
+                    netloc = f"***:***@{parsed.hostname}:{parsed.port}"
+                else:
+                    netloc = f"***:***@{parsed.hostname}"
+            elif parsed.port:
+                netloc = f"{parsed.hostname}:{parsed.port}"
+
+            # Mask sensitive query params
+            query_params = parse_qs(parsed.query)
+            masked_query = []
+            matcher = SecurityUtils._key_matcher()
+            for k, v in query_params.items():
+                if matcher.matches(k):
+                    masked_query.append(f"{k}=***")
+                else:
+                    masked_query.append(f"{k}={v[0]}")
+            
+            parsed = parsed._replace(netloc=netloc, query="&".join(masked_query))
+            return urlunparse(parsed)
+
+        except Exception:
+            return "***"
+
+    @staticmethod
+    def register_secrets(*secrets):
+        """Mask these exact values (URIs, tokens, passwords) in every sanitized message
+
+        URIs are replaced with their sanitize_uri() form, anything else with
+        ***. Empty values are ignored and duplicates kept once.
+        """
+        known = SecurityUtils.KNOWN_SECRETS + [str(secret) for secret in secrets if secret]
+        SecurityUtils.KNOWN_SECRETS = list(dict.fromkeys(known))
+        SecurityUtils._forget_redactors()
+
+    @staticmethod
+    def clear_secrets():
+        """Forget every registered secret and the redactors built from them"""
+        SecurityUtils.KNOWN_SECRETS = []
+        SecurityUtils._forget_redactors()
+
+    @staticmethod
+    def _forget_redactors():
+        # Compiled redactors hold the raw secrets; drop them rather than let them age out
+        _build_secret_redactor.cache_clear()
+        SecurityUtils._secrets = None
+
+    @staticmethod
+    def _secret_redactor(sensitive_uris=None):
+        known, keys = SecurityUtils.KNOWN_SECRETS, SecurityUtils.SENSITIVE_KEYS
+        cached = SecurityUtils._secrets
+        if cached is not None:
+            if cached[0] == known and cached[2] == keys:
+                if cached[1] == sensitive_uris:
+                    return cached[3]
+            else:
+                # KNOWN_SECRETS or SENSITIVE_KEYS were edited directly
+                _build_secret_redactor.cache_clear()
+        secrets = tuple(known) + tuple(sensitive_uris or ())
+        # Cached per sensitive_uris under the current configuration only
+        redactor = _build_secret_redactor(secrets, tuple(keys)) if secrets else None
+        SecurityUtils._secrets = (list(known), sensitive_uris and list(sensitive_uris), list(keys), redactor)
+        return redactor
+
+    @staticmethod
+    def _get_redactor():
+        """Compile the redaction patterns once per REDACTION_KEYS configuration"""
+        keys = tuple(SecurityUtils.REDACTION_KEYS)
+        cached = SecurityUtils._redactor
+        if cached is not None and cached[0] == keys:
+            return cached
+
+        alternation = "|".join(re.escape(k) for k in sorted(keys, key=len, reverse=True))
+        combined = re.compile(
+            rf"(?P<creds>{_INLINE_CREDS})|\b(?P<key>{alternation})\s*[=:]\s*[^\s&]+",
+            re.IGNORECASE,
+        )
+        # A match whose value ends in another key (e.g. "key=password :x") can
+        # hide a match the sequential rules would have found; detect it here.
+        tail = re.compile(rf"\b(?:{alternation})[=:]?\Z", re.IGNORECASE)
+        sequential = [
+            (re.compile(rf"\b{re.escape(k)}\s*[=:]\s*[^\s&]+", re.IGNORECASE), f"{k}=***")
+            for k in keys
+        ]
+        replacements = {k.lower(): f"{k}=***" for k in reversed(keys)}
+
+        SecurityUtils._redactor = (keys, combined, tail, sequential, replacements)
+        return SecurityUtils._redactor
+
+    @staticmethod
+    def sanitize_error_message(error_msg: str, sensitive_uris=None) -> str:
+        """Sanitize sensitive URIs, passwords, tokens in error messages"""
+        if not error_msg:
+            return error_msg
+
+        # Replace registered secrets and known URIs in one search
+        secrets = SecurityUtils._secret_redactor(sensitive_uris)
+        if secrets is not None:
+            pattern, replace = secrets
+            error_msg = pattern.sub(replace, error_msg)
+
+        # Every rule needs a "=" or ":" separator, so most messages skip the regex
+        if "=" not in error_msg and ":" not in error_msg:
+            return error_msg
+
+        _, combined, tail, sequential, replacements = SecurityUtils._get_redactor()
+        ambiguous = False
+
+        def redact(match):
+            nonlocal ambiguous
+            if match.group("creds") is not None:
+                return "://***:***@"
+            text = match.group(0)
+            end = match.end()
+            if "://" in text or (
+                end < len(error_msg) and error_msg[end].isspace() and tail.search(text)
+            ):
+                ambiguous = True
+            return replacements[match.group("key").lower()]
+
+        # Mask inline creds in URIs and sensitive key=value patterns in one pass
+        redacted = combined.sub(redact, error_msg)
+        if not ambiguous:
+            return redacted
+
+        # Overlapping matches: apply the rules one at a time, in priority order
+        error_msg = _INLINE_CREDS_RE.sub("://***:***@", error_msg)
+        for pattern, replacement in sequential:
+            error_msg = pattern.sub(replacement, error_msg)
+
+        return error_msg
+
+    @staticmethod
+    def sanitize_dict(data: dict, sensitive_keys=None, max_depth=None, max_items=None) -> dict:
+        """Sanitize dictionary by masking sensitive keys at any depth
+
+        Dicts, lists and tuples are walked iteratively, and only containers on
+        the path to a changed value are copied; untouched subtrees are returned
+        as the original objects. Containers nested deeper than max_depth are
+        replaced with TRUNCATED, and containers longer than max_items keep only
+        their first max_items entries plus a truncation marker. A container
+        that contains itself (directly or further down) is replaced with
+        CIRCULAR where it repeats.
+        """
+        if not isinstance(data, _CONTAINERS):
+            return data
+
+        matcher = SecurityUtils._key_matcher(sensitive_keys)
+
+        def is_sensitive(key):
+            return isinstance(key, str) and matcher.matches(key)
+
+        stack = [_Frame(data, 0, max_items)]
+        # Containers on the path from data to the current frame
+        path = {id(data)}
+        while True:
+            frame = stack[-1]
+            child = None
+            for key, value in frame.items:
+                if frame.is_dict and is_sensitive(key):
+                    frame.add(key, value, "***")
+                elif isinstance(value, _CONTAINERS):
+                    if id(value) in path:
+                        frame.add(key, value, CIRCULAR)
+                    elif max_depth is not None and frame.depth >= max_depth:
+                        frame.add(key, value, TRUNCATED)
+                    else:
+                        child = _Frame(value, frame.depth + 1, max_items, key)
+                        break
+                else:
+                    frame.add(key, value, value)
+
+            if child is not None:
+                stack.append(child)
+                path.add(id(child.obj))
+                continue
+
+            stack.pop()
+            path.discard(id(frame.obj))
+            result = frame.result()
+            if not stack:
+                return result
+            stack[-1].add(frame.key, frame.obj, result)
+
+
+class _KeyMatcher:
+    """Matches keys against a fixed set of sensitive substrings in one search"""
+    def __init__(self, sensitive_keys, cache_size):
+        self.sensitive_keys = sensitive_keys
+        self._pattern = None
+        if sensitive_keys:
+            alternation = "|".join(re.escape(sk) for sk in sorted(sensitive_keys, key=len))
+            self._pattern = re.compile(alternation)
+        self.matches = functools.lru_cache(maxsize=cache_size)(self._matches)
+
+    def _matches(self, key):
+        return self._pattern is not None and self._pattern.search(key.lower()) is not None
+
+
+@functools.lru_cache(maxsize=8)
+def _build_key_matcher(sensitive_keys, cache_size):
+    return _KeyMatcher(sensitive_keys, cache_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_secret_redactor(secrets, sensitive_keys):
+    """(pattern, replace) masking every secret; each one is sanitized only here"""
+    secrets = [secret for secret in dict.fromkeys(secrets) if secret]
+    if not secrets:
+        return None
+    replacements = {secret: SecurityUtils.sanitize_uri(secret) if "://" in secret else "***"
+                    for secret in secrets}
+    return re.compile(_trie_pattern(secrets)), lambda match: replacements[match.group()]
+
+
+def _trie_pattern(words):
+    """Regex matching any of words, longest first, with shared prefixes factored out
+
+    re tries the branches of a flat alternation one by one at every
+    position; a trie only follows the branches whose prefix matched, which
+    is several times faster with dozens of secrets.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = None
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # Greedy, so a URI still wins over a password it starts with
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+# Sets are left alone: their members are hashable, so they can't hold dicts
+_CONTAINERS = (dict, list, tuple)
+TRUNCATED = "<truncated>"
+CIRCULAR = "<circular reference>"
+
+
+class _Frame:
+    """One container being walked by SecurityUtils.sanitize_dict"""
+    __slots__ = ("obj", "depth", "key", "is_dict", "items", "index", "out", "max_items")
+
+    def __init__(self, obj, depth, max_items, key=None):
+        self.obj = obj
+        self.depth = depth
+        self.key = key
+        self.is_dict = isinstance(obj, dict)
+        items = obj.items() if self.is_dict else enumerate(obj)
+        if max_items is not None and len(obj) > max_items:
+            items = itertools.islice(items, max_items)
+        self.items = iter(items)
+        self.index = 0
+        self.out = None
+        self.max_items = max_items
+
+    def _copy_prefix(self, count):
+        if self.is_dict:
+            return dict(itertools.islice(self.obj.items(), count))
+        return list(self.obj[:count])
+
+    def add(self, key, old, new):
+        if self.out is None:
+            if new is old:
+                self.index += 1
+                return
+            self.out = self._copy_prefix(self.index)
+        if self.is_dict:
+            self.out[key] = new
+        else:
+            self.out.append(new)
+        self.index += 1
+
+    def result(self):
+        extra = len(self.obj) - self.max_items if self.max_items is not None else 0
+        if self.out is None:
+            if extra <= 0:
+                return self.obj
+            self.out = self._copy_prefix(self.index)
+        if extra > 0:
+            if self.is_dict:
+                self.out[TRUNCATED] = f"{extra} more items"
+            else:
+                self.out.append(f"{TRUNCATED} {extra} more items")
+        return tuple(self.out) if isinstance(self.obj, tuple) else self.out
@@ -0,0 +1,108 @@
+import json
+import logging
+from functools import lru_cache
+from .sensitive_info import SecurityUtils
+
+CONTEXT_MAX_DEPTH = 10
+CONTEXT_MAX_ITEMS = 200
+
+_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=str).encode
+
+
+@lru_cache(maxsize=1024)
+def _key_prefixes(keys):
+    """JSON '"key":' prefixes for a context key order, reused across calls"""
+    return tuple(_encode(str(key)) + ":" for key in keys)
+
+
+def _to_json_fields(fields):
+    prefixes = _key_prefixes(tuple(fields))
+    return ",".join(prefix + _encode(value) for prefix, value in zip(prefixes, fields.values()))
+
+
+class LazyContext:
+    """Structured context attached to a record as record.context
+
+    Nothing is sanitized or serialized until a handler asks for it, so
+    records filtered out by handler levels never pay for the context.
+    """
+    __slots__ = ("_static_json", "_fields", "_sanitized")
+
+    def __init__(self, static_json, fields):
+        self._static_json = static_json
+        self._fields = fields
+        self._sanitized = None
+
+    def as_dict(self):
+        if self._sanitized is None:
+            self._sanitized = SecurityUtils.sanitize_dict(
+                self._fields, max_depth=CONTEXT_MAX_DEPTH, max_items=CONTEXT_MAX_ITEMS
+            )
+        return self._sanitized
+
+    def to_json(self):
+        dynamic = _to_json_fields(self.as_dict()) if self._fields else ""
+        return "{" + ",".join(part for part in (self._static_json, dynamic) if part) + "}"
+
+    __str__ = to_json
+
+
+class StructuredLogger:
+    """Level-gated structured logging bound to a logger and static fields
+
+    log.info("order %s paid", order_id, amount=total) checks isEnabledFor
+    before doing anything else; the message arguments and keyword context
+    stay unevaluated on the record (as record.context, a LazyContext) until
+    a handler formats it. Static fields given to get_logger() or bind() are
+    sanitized and serialized once.
+    """
+    __slots__ = ("logger", "static_fields", "_static_json")
+
+    def __init__(self, logger, static_fields=None):
+        self.logger = logger
+        self.static_fields = SecurityUtils.sanitize_dict(static_fields or {})
+        self._static_json = _to_json_fields(self.static_fields)
+
+    def bind(self, **fields):
+        return StructuredLogger(self.logger, {**self.static_fields, **fields})
+
+    def log(self, level, msg, *args, exc_info=None, **context):
+        if not self.logger.isEnabledFor(level):
+            return
+        self.logger._log(level, msg, args, exc_info=exc_info,
+                         extra={"context": LazyContext(self._static_json, context)}, stacklevel=2)
+
+    def debug(self, msg, *args, **context):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger._log(logging.DEBUG, msg, args,
+                             extra={"context": LazyContext(self._static_json, context)}, stacklevel=2)
+
+    def info(self, msg, *args, **context):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger._log(logging.INFO, msg, args,
+                             extra={"context": LazyContext(self._static_json, context)}, stacklevel=2)
+
+    def warning(self, msg, *args, **context):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger._log(logging.WARNING, msg, args,
+                             extra={"context": LazyContext(self._static_json, context)}, stacklevel=2)
+
+    def error(self, msg, *args, exc_info=None, **context):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger._log(logging.ERROR, msg, args, exc_info=exc_info,
+                             extra={"context": LazyContext(self._static_json, context)}, stacklevel=2)
+
+    def exception(self, msg, *args, **context):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger._log(logging.ERROR, msg, args, exc_info=True,
+                             extra={"context": LazyContext(self._static_json, context)}, stacklevel=2)
+
+    def critical(self, msg, *args, exc_info=None, **context):
+        if self.logger.isEnabledFor(logging.CRITICAL):
+            self.logger._log(logging.CRITICAL, msg, args, exc_info=exc_info,
+                             extra={"context": LazyContext(self._static_json, context)}, stacklevel=2)
+
+
+def get_logger(name=None, **static_fields):
+    """StructuredLogger for logging.getLogger(name) with per-logger static fields"""
+    return StructuredLogger(logging.getLogger(name), static_fields)
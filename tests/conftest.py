@@ -0,0 +1,13 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+PACKAGE_NAME = "logging_package"
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules use relative imports, so load their directory as a package
+if PACKAGE_NAME not in sys.modules:
+    package = importlib.util.module_from_spec(importlib.machinery.ModuleSpec(PACKAGE_NAME, None, is_package=True))
+    package.__path__ = [PACKAGE_DIR]
+    sys.modules[PACKAGE_NAME] = package
@@ -0,0 +1,79 @@
+import io
+import logging
+
+import pytest
+
+from logging_package.log_config import SanitizingFormatter, log_with_context
+from logging_package.sensitive_info import SecurityUtils
+
+
+@pytest.fixture
+def sanitizer_calls(monkeypatch):
+    calls = []
+    sanitize = SecurityUtils.sanitize_error_message
+
+    def counting(error_msg, sensitive_uris=None):
+        calls.append(error_msg)
+        return sanitize(error_msg, sensitive_uris)
+
+    monkeypatch.setattr(SecurityUtils, "sanitize_error_message", staticmethod(counting))
+    return calls
+
+
+@pytest.fixture
+def three_handlers():
+    logger = logging.getLogger("tests.sanitize_once")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    streams = [io.StringIO() for _ in range(3)]
+    for stream in streams:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(SanitizingFormatter("%(levelname)s %(message)s"))
+        logger.addHandler(handler)
+    yield logger, streams
+    logger.handlers = []
+
+
+def test_record_is_sanitized_once_for_all_handlers(sanitizer_calls, three_handlers):
+    logger, streams = three_handlers
+    logger.info("login with password=%s", "hunter2")
+
+    assert len(sanitizer_calls) == 1
+    for stream in streams:
+        assert stream.getvalue() == "INFO login with password=***\n"
+
+
+def test_exception_text_is_sanitized_once_for_all_handlers(sanitizer_calls, three_handlers):
+    logger, streams = three_handlers
+    try:
+        raise RuntimeError("token=abc123")
+    except RuntimeError:
+        logger.exception("request failed")
+
+    assert len(sanitizer_calls) == 2
+    for stream in streams:
+        assert "token=***" in stream.getvalue()
+        assert "abc123" not in stream.getvalue()
+
+
+@pytest.mark.parametrize("level", ["info", "INFO", "Info", logging.INFO])
+def test_log_with_context_accepts_any_level_spelling(caplog, level):
+    logger = logging.getLogger("tests.context")
+    with caplog.at_level(logging.INFO, logger="tests.context"):
+        log_with_context(logger, level, "order placed", order_id=42, token="abc123")
+
+    [record] = caplog.records
+    assert record.levelno == logging.INFO
+    assert record.order_id == 42
+    assert record.token == "***"
+
+
+def test_log_with_context_reports_unknown_level_without_raising(caplog):
+    logger = logging.getLogger("tests.context")
+    with caplog.at_level(logging.INFO, logger="tests.context"):
+        log_with_context(logger, "verbose", "order placed", order_id=42)
+
+    [record] = caplog.records
+    assert record.levelno == logging.WARNING
+    assert "order placed" in record.getMessage()
+    assert "'verbose'" in record.getMessage()
@@ -0,0 +1,165 @@
+import datetime
+import json
+import logging
+import threading
+import time
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+from pymongo.errors import AutoReconnect
+
+from logging_package.mongo_logs import MongoHandler
+from logging_package.structured_logging import get_logger
+
+
+class FlakyCollection:
+    """mongomock collection whose writes can be made to fail like a lost server"""
+    def __init__(self, collection):
+        self.collection = collection
+        self.down = False
+        self.error = None
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def insert_many(self, documents, ordered=True):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        if self.down:
+            raise AutoReconnect("connection refused")
+        return self.collection.insert_many(documents, ordered=ordered)
+
+
+@pytest.fixture
+def collection():
+    return FlakyCollection(mongomock.MongoClient()["logs"]["app"])
+
+
+@pytest.fixture
+def make_handler(tmp_path, collection):
+    handlers = []
+
+    def make(**kwargs):
+        options = {"spill_path": str(tmp_path / "spill.jsonl"), "flush_interval": 60.0,
+                   "retry_interval": 0.0, "collection": collection}
+        handler = MongoHandler(None, None, None, **{**options, **kwargs})
+        handlers.append(handler)
+        return handler
+
+    yield make
+    for handler in handlers:
+        handler.close()
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("tests.mongo")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    yield logger
+    logger.handlers = []
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_failed_write_spills_and_replays(make_handler, collection, logger, tmp_path):
+    handler = make_handler()
+    logger.addHandler(handler)
+    collection.down = True
+    for i in range(3):
+        logger.info("record %d", i)
+    handler.flush()
+    assert handler.spilled == 3
+    assert len((tmp_path / "spill.jsonl").read_text().splitlines()) == 3
+
+    collection.down = False
+    logger.info("record 3")
+    handler.flush()
+    assert handler.inserted == 4
+    assert [d["message"] for d in collection.find().sort("timestamp", 1)] == [f"record {i}" for i in range(4)]
+    assert isinstance(collection.find_one()["timestamp"], datetime.datetime)
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_torn_spill_line_is_quarantined(make_handler, collection, logger, tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    good = json.dumps({"timestamp": {"$date": "2026-01-01T00:00:00+00:00"}, "message": "kept"})
+    spill.write_text(good + "\n" + good[:20])
+    handler = make_handler()
+    logger.addHandler(handler)
+    collection.down = True
+    logger.info("spilled after the torn line")
+    handler.flush()
+
+    collection.down = False
+    handler.flush()
+    assert sorted(d["message"] for d in collection.find()) == ["kept", "spilled after the torn line"]
+    assert handler.dropped == 1
+    assert (tmp_path / "spill.jsonl.bad").read_text() == good[:20] + "\n"
+
+
+def test_context_values_bson_cannot_hold_are_stringified(make_handler, collection, logger):
+    handler = make_handler()
+    logger.addHandler(handler)
+    get_logger("tests.mongo").info("paid", day=datetime.date(2026, 1, 2), big=2 ** 70,
+                                   tags={"a"}, nested={1: [datetime.date(2026, 1, 3)]})
+    handler.flush()
+    context = collection.find_one()["context"]
+    assert context == {"day": "2026-01-02", "big": str(2 ** 70), "tags": "{'a'}",
+                       "nested": {"1": ["2026-01-03"]}}
+
+
+def test_flusher_survives_unexpected_errors(make_handler, collection, logger):
+    handler = make_handler(flush_interval=0.01)
+    logger.addHandler(handler)
+    collection.error = ValueError("cannot encode object")
+    logger.info("unencodable")
+    wait_until(lambda: handler.dropped == 1)
+    logger.info("written")
+    wait_until(lambda: handler.inserted == 1)
+    assert handler._flusher.is_alive()
+    assert [d["message"] for d in collection.find()] == ["written"]
+
+
+def test_on_connect_runs_on_the_flusher_without_the_io_lock(monkeypatch, collection):
+    ready = threading.Event()
+
+    def connect(handler):
+        ready.wait(5.0)
+        handler.collection = collection
+
+    monkeypatch.setattr(MongoHandler, "_connect", connect)
+    handler = MongoHandler("mongodb://localhost", "logs", "app", background_connect=True, flush_interval=60.0)
+    calls = []
+    handler.on_connect = lambda: calls.append((threading.current_thread(), handler._io_lock.locked()))
+    ready.set()
+    wait_until(lambda: calls)
+    handler.close()
+    assert calls == [(handler._flusher, False)]
+
+
+def test_close_spills_instead_of_waiting_for_the_connection(monkeypatch, logger, tmp_path):
+    unblock = threading.Event()
+
+    def connect(handler):
+        unblock.wait(5.0)
+        raise AutoReconnect("connection timed out")
+
+    monkeypatch.setattr(MongoHandler, "_connect", connect)
+    handler = MongoHandler("mongodb://localhost", "logs", "app", background_connect=True,
+                           spill_path=str(tmp_path / "spill.jsonl"))
+    logger.addHandler(handler)
+    logger.info("buffered while connecting")
+    started = time.monotonic()
+    handler.close()
+    assert time.monotonic() - started < 1.0
+    unblock.set()
+    assert handler.spilled == 1
+    assert "buffered while connecting" in (tmp_path / "spill.jsonl").read_text()
@@ -1,50 +1,251 @@
-import logging
-import os
-import glob
-import time
-from logging.handlers import TimedRotatingFileHandler
-from datetime import datetime, timedelta
-
-class TimedRotatingFileHandlerWithDeletion(TimedRotatingFileHandler):
-    def __init__(self, filename, when='midnight', interval=1, backupCount=0, 
-                 encoding=None, delay=False, utc=False, atTime=None,
-                 delete_after_days=7):
-        super().__init__(filename, when, interval, backupCount, 
-                        encoding, delay, utc, atTime)
-        self.delete_after_days = delete_after_days
-        self._delete_old_logs()
-    
-    def _delete_old_logs(self):
-        """Delete log files older than delete_after_days"""
-        if self.delete_after_days <= 0:
-            return
-            
-        current_time = time.time()
-        cutoff_time = current_time - (self.delete_after_days * 24 * 3600)
-        
-        # Get all log files matching the pattern
-        log_dir = os.path.dirname(self.baseFilename) or '.'
-        log_base = os.path.basename(self.baseFilename)
-        
-        # Pattern for rotated files
-        patterns = [
-            f"{log_base}.*",
-            f"{log_base}.*.*",
-        ]
-        
-        for pattern in patterns:
-            files = glob.glob(os.path.join(log_dir, pattern))
-            for file_path in files:
-                try:
-                    if (os.path.isfile(file_path) and 
-                        os.path.getmtime(file_path) < cutoff_time and 
-                        os.path.abspath(file_path) != os.path.abspath(self.baseFilename)):
-                        os.remove(file_path)
-                        print(f"Deleted old log file: {file_path}")
-                except (OSError, Exception) as e:
-                    print(f"Error deleting log file {file_path}: {e}")
-    
-    def doRollover(self):
-        """Override doRollover to include deletion of old files"""
-        super().doRollover()
-        self._delete_old_logs()
\ No newline at end of file
+import gzip
+import io
+import locale
+import logging
+import os
+import glob
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from logging.handlers import TimedRotatingFileHandler
+from datetime import datetime, timedelta
+from .log_index import INDEX_SUFFIX, block_compressor, index_path, load_zstandard, write_compressed
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+DURABILITY_LEVELS = ("record", "batch", "fsync_batch", "fsync_interval")
+
+
+class TimedRotatingFileHandlerWithDeletion(TimedRotatingFileHandler):
+    """TimedRotatingFileHandler that compresses and expires rotated files
+
+    doRollover only renames the current file; compression ("gzip", or
+    "zstd" when the zstandard package is installed) and deletion of files
+    older than delete_after_days run on a background worker pool.
+    """
+    def __init__(self, filename, when='midnight', interval=1, backupCount=0,
+                 encoding=None, delay=False, utc=False, atTime=None,
+                 delete_after_days=7, compress="gzip", max_workers=1):
+        super().__init__(filename, when, interval, backupCount,
+                        encoding, delay, utc, atTime)
+        self.delete_after_days = delete_after_days
+        if compress == "zstd" and load_zstandard() is None:
+            compress = "gzip"
+        self.compress = compress
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="log-archiver")
+        self._pending = set()
+        self._submit(self._archive_existing)
+
+    def _delete_old_logs(self):
+        """Delete log files older than delete_after_days"""
+        if self.delete_after_days <= 0:
+            return
+
+        current_time = time.time()
+        cutoff_time = current_time - (self.delete_after_days * 24 * 3600)
+
+        # Get all log files matching the pattern
+        log_dir = os.path.dirname(self.baseFilename) or '.'
+        log_base = os.path.basename(self.baseFilename)
+
+        # Pattern for rotated files
+        patterns = [
+            f"{log_base}.*",
+            f"{log_base}.*.*",
+        ]
+
+        for pattern in patterns:
+            files = glob.glob(os.path.join(log_dir, pattern))
+            for file_path in files:
+                try:
+                    if (os.path.isfile(file_path) and
+                        os.path.getmtime(file_path) < cutoff_time and
+                        os.path.abspath(file_path) != os.path.abspath(self.baseFilename)):
+                        os.remove(file_path)
+                        print(f"Deleted old log file: {file_path}")
+                except (OSError, Exception) as e:
+                    print(f"Error deleting log file {file_path}: {e}")
+
+    def _compress_file(self, path):
+        """Compress a rotated file next to itself and remove the original
+
+        The archive is written as independently compressed blocks with a
+        sidecar index (see log_index), so queries can seek into it.
+        """
+        if not self.compress or not os.path.exists(path):
+            return path
+
+        suffix = ".zst" if self.compress == "zstd" else ".gz"
+        target = path + suffix
+        partial = target + ".tmp"
+        stat = os.stat(path)
+        codec = "zstd" if self.compress == "zstd" else "gzip"
+        with open(partial, "wb") as raw:
+            index = write_compressed(path, raw, codec, block_compressor(codec, stat.st_mtime))
+        # Keep the original mtime so age-based retention still applies
+        os.utime(partial, (stat.st_atime, stat.st_mtime))
+        os.replace(partial, target)
+        index.save(target)
+        os.remove(path)
+        if os.path.exists(index_path(path)):
+            os.remove(index_path(path))
+        return target
+
+    def _archive(self, path):
+        try:
+            self._compress_file(path)
+        except OSError as e:
+            print(f"Error compressing log file {path}: {e}")
+        self._delete_old_logs()
+
+    def _archive_existing(self):
+        """Compress rotated files left uncompressed by an earlier run"""
+        log_dir = os.path.dirname(self.baseFilename) or '.'
+        prefix = os.path.basename(self.baseFilename) + "."
+        for name in sorted(os.listdir(log_dir)):
+            if name.startswith(prefix) and self.extMatch.match(name[len(prefix):]) \
+                    and not name.endswith(COMPRESSED_SUFFIXES + (INDEX_SUFFIX,)):
+                try:
+                    self._compress_file(os.path.join(log_dir, name))
+                except OSError as e:
+                    print(f"Error compressing log file {name}: {e}")
+        self._delete_old_logs()
+
+    def rotate(self, source, dest):
+        """Rename the current file and queue the rotated one for archiving"""
+        super().rotate(source, dest)
+        if os.path.exists(dest):
+            self._submit(self._archive, dest)
+
+    def _submit(self, func, *args):
+        future = self._executor.submit(func, *args)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+    def wait_for_archives(self):
+        """Block until every queued compression and cleanup has finished"""
+        wait(list(self._pending))
+
+    def close(self):
+        super().close()
+        self._executor.shutdown(wait=True)
+
+
+class BufferedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """TimedRotatingFileHandler that group-commits records
+
+    Formatted records are encoded into one reusable buffer that is written
+    with a single write() once buffer_size bytes are waiting or
+    flush_interval seconds have passed. durability picks the trade-off:
+
+    - record: write every record immediately (like TimedRotatingFileHandler)
+    - batch: write per batch
+    - fsync_batch: write and fsync per batch
+    - fsync_interval: write per batch, fsync at most every fsync_interval seconds
+
+    Rotation (when, interval, suffix) is inherited unchanged.
+    """
+    def __init__(self, filename, when='midnight', interval=1, backupCount=0,
+                 encoding=None, delay=False, utc=False, atTime=None,
+                 durability="batch", buffer_size=64 * 1024, flush_interval=1.0,
+                 fsync_interval=5.0):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability {durability!r}, expected one of {DURABILITY_LEVELS}")
+        self.durability = durability
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self._buffer = bytearray()
+        self._last_fsync = time.monotonic()
+        super().__init__(filename, when, interval, backupCount,
+                         encoding, delay, utc, atTime)
+        # FileHandler maps encoding=None to "locale", like open() in text mode
+        self._codec = self.encoding
+        if not self._codec or self._codec == "locale":
+            self._codec = locale.getpreferredencoding(False)
+        self._stop = threading.Event()
+        self._flusher = None
+        if durability != "record":
+            self._flusher = threading.Thread(target=self._run_flusher, name="log-file-flusher", daemon=True)
+            self._flusher.start()
+
+    def _open(self):
+        # Unbuffered binary file: every flush of our buffer is exactly one write
+        return open(self.baseFilename, "ab", buffering=0)
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            data = (self.format(record) + self.terminator).encode(self._codec, self.errors or "strict")
+            self.acquire()
+            try:
+                self._buffer += data
+                if self.durability == "record" or len(self._buffer) >= self.buffer_size:
+                    self._write_buffer()
+            finally:
+                self.release()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _write_buffer(self, force_fsync=False):
+        if self.stream is None:
+            if not self._buffer:
+                return
+            self.stream = self._open()
+        if self._buffer:
+            self.stream.write(self._buffer)
+            del self._buffer[:]
+            if self.durability == "fsync_batch":
+                os.fsync(self.stream.fileno())
+                self._last_fsync = time.monotonic()
+        if self.durability == "fsync_interval" and (
+                force_fsync or time.monotonic() - self._last_fsync >= self.fsync_interval):
+            os.fsync(self.stream.fileno())
+            self._last_fsync = time.monotonic()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._write_buffer()
+        finally:
+            self.release()
+
+    def doRollover(self):
+        """Write out buffered records before the file is renamed"""
+        self.acquire()
+        try:
+            self._write_buffer(force_fsync=True)
+        finally:
+            self.release()
+        super().doRollover()
+
+    def close(self):
+        self._stop.set()
+        self.acquire()
+        try:
+            self._write_buffer(force_fsync=True)
+        finally:
+            self.release()
+        super().close()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=1.0)
+
+
+def open_rotated_log(path, encoding="utf-8"):
+    """Open a plain, .gz or .zst log file as a streaming text reader"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding=encoding)
+    if path.endswith(".zst"):
+        zstandard = load_zstandard()
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True, read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding=encoding)
+    return open(path, encoding=encoding)